@@ -0,0 +1,212 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# benchmark.py
+# Last Updated:
+# Purpose: Times how graphs.py scales over a sweep of synthetic CSV sizes.
+#          Each size is timed in three stages:
+#          - parse: reading the CSV into Datasets
+#          - geometry: working out every shape, with a writer that draws nothing
+#          - serialize: the extra time each writer backend takes to write
+# Program Uses: ./benchmark.py --sizes 100,1000,10000 --output run.json
+# Notes:
+#       - The report is JSON, so runs can be compared across commits
+#       - Peak memory is measured with tracemalloc in a separate pass, so it
+#         doesn't slow down the timings
+#
+import argparse # for the command line options
+import contextlib # for hiding what the graphs print
+import json     # for the report
+import os       # for file sizes
+import platform # for the report
+import shutil   # for removing the temporary files
+import subprocess # for the git commit of the report
+import tempfile # for the synthetic CSV files
+import time     # for the timings
+import tracemalloc # for the peak memory
+
+import graphs
+import svg_writer
+from generate_csv import generate_csv
+
+class NullWriter(svg_writer.Writer):
+  """
+    Writer backend that only counts the elements, for timing the layout
+  """
+  name = "null"
+
+  def __init__(self, output, size=None, **settings):
+    self.elements = 0
+
+  def rect(self, insert, size, fill):
+    self.elements += 1
+
+  def circle(self, center, r, fill):
+    self.elements += 1
+
+  def path(self, d, stroke, stroke_width):
+    self.elements += 1
+
+  def polyline(self, points, stroke, stroke_width):
+    self.elements += 1
+
+  def arc(self, p0, p1, radius, stroke, stroke_width):
+    self.elements += 1
+
+  def begin_group(self, **attributes):
+    self.elements += 1
+
+  def end_group(self):
+    pass
+
+  def close(self):
+    pass
+
+svg_writer.WRITERS[NullWriter.name] = NullWriter
+
+def measure(function, repeat, memory):
+  """
+    Runs the given function `repeat` times and returns the best wall time,
+    plus the peak traced memory of one more run when `memory` is set
+  """
+  best = None
+  for run in range(0, repeat):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+      best = elapsed
+
+  peak = None
+  if memory:
+    tracemalloc.start()
+    try:
+      function()
+      peak = tracemalloc.get_traced_memory()[1]
+    finally:
+      tracemalloc.stop()
+  return best, peak
+
+def render_all(datasets, out_dir, writer):
+  """
+    Draws the given datasets with the given writer backend, quietly
+  """
+  options = {"writer" : writer, "out_dir" : out_dir}
+  with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    for dataset in datasets:
+      graphs.draw_rect_graph(dataset, options)
+
+def output_size(out_dir):
+  """
+    Returns the total size of the files written to the given directory
+  """
+  return sum(os.path.getsize(os.path.join(out_dir, name)) for name in os.listdir(out_dir))
+
+def stage(seconds, peak, amount, unit):
+  """
+    Returns the report entry of one stage
+  """
+  return {
+    "seconds" : seconds,
+    unit + "_per_second" : amount / seconds if seconds > 0 else None,
+    "peak_memory_bytes" : peak,
+  }
+
+def benchmark_size(work_dir, points, args):
+  """
+    Benchmarks one CSV size and returns its part of the report
+  """
+  csv_file = os.path.join(work_dir, "bench_%d.csv" % points)
+  total_points = generate_csv(csv_file, args.groups, args.rows, points,
+    args.circle_ratio, args.padding, args.seed)
+  csv_size = os.path.getsize(csv_file)
+
+  parse_time, parse_peak = measure(lambda: list(graphs.read_groups(csv_file)),
+    args.repeat, args.memory)
+  datasets = list(graphs.read_groups(csv_file))
+
+  out_dir = os.path.join(work_dir, "out_%d" % points)
+  os.makedirs(out_dir, exist_ok=True)
+  geometry_time, geometry_peak = measure(lambda: render_all(datasets, out_dir, "null"),
+    args.repeat, args.memory)
+
+  result = {
+    "points_per_row" : points,
+    "groups" : args.groups,
+    "rows_per_group" : args.rows,
+    "total_points" : total_points,
+    "csv_bytes" : csv_size,
+    "parse" : stage(parse_time, parse_peak, csv_size, "bytes"),
+    "geometry" : stage(geometry_time, geometry_peak, total_points, "points"),
+    "serialize" : {},
+  }
+  result["parse"]["points_per_second"] = total_points / parse_time if parse_time > 0 else None
+
+  for writer in args.writers:
+    render_time, render_peak = measure(lambda: render_all(datasets, out_dir, writer),
+      args.repeat, args.memory)
+    written = output_size(out_dir)
+    serialize_time = max(render_time - geometry_time, 0.0)
+    result["serialize"][writer] = stage(serialize_time, render_peak, written, "bytes")
+    result["serialize"][writer]["total_seconds"] = render_time
+    result["serialize"][writer]["output_bytes"] = written
+    for name in os.listdir(out_dir):
+      os.remove(os.path.join(out_dir, name))
+  return result
+
+def git_commit():
+  """
+    Returns the current git commit, if there is one
+  """
+  try:
+    return subprocess.check_output(["git", "rev-parse", "HEAD"],
+      cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def main(argv=None):
+  """
+    Command line interface
+  """
+  parser = argparse.ArgumentParser(description="Benchmarks graphs.py over a sweep of CSV sizes")
+  parser.add_argument("--sizes", default="100,1000,10000",
+    help="comma separated points per row to sweep over")
+  parser.add_argument("--groups", type=int, default=20, help="groups per CSV file")
+  parser.add_argument("--rows", type=int, default=5, help="rows (series) per group")
+  parser.add_argument("--circle-ratio", type=float, default=0.2,
+    help="share of the groups that are pie/donut graphs")
+  parser.add_argument("--padding", type=int, default=0,
+    help="empty columns added at the end of every row")
+  parser.add_argument("--seed", type=int, default=0, help="random seed")
+  parser.add_argument("--writers", default="stream,compact",
+    help="comma separated writer backends to time")
+  parser.add_argument("--repeat", type=int, default=3, help="runs per stage, the best one counts")
+  parser.add_argument("--no-memory", dest="memory", action="store_false",
+    help="skip the tracemalloc peak memory pass")
+  parser.add_argument("--output", metavar="FILE", help="write the JSON report to FILE")
+  args = parser.parse_args(argv)
+  args.writers = [writer for writer in args.writers.split(",") if writer]
+
+  report = {
+    "commit" : git_commit(),
+    "python" : platform.python_version(),
+    "platform" : platform.platform(),
+    "results" : [],
+  }
+  work_dir = tempfile.mkdtemp(prefix="graphs_bench_")
+  try:
+    for points in [int(size) for size in args.sizes.split(",") if size]:
+      report["results"].append(benchmark_size(work_dir, points, args))
+  finally:
+    shutil.rmtree(work_dir)
+
+  text = json.dumps(report, indent=2)
+  if args.output:
+    with open(args.output, "w") as report_output:
+      report_output.write(text + "\n")
+  else:
+    print(text)
+  return 0
+
+if __name__ == "__main__":
+  exit(main())
@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# bundle.py
+# Last Updated:
+# Purpose: Writes every graph of a CSV file into a single SVG file, instead
+#          of a file per group. Each graph is a <symbol id="chartN"> and the
+#          definitions the graphs share (eg: the dots of the compact writer)
+#          are written once, in <defs> between the symbols.
+#          A JSON manifest next to the bundle maps every group name to its
+#          symbol id and byte range, so a single graph can be cut out of the
+#          bundle without parsing it.
+# Program Uses: ./bundle.py charts.svg "group name" > graph.svg
+# Notes:
+#       - The manifest is saved as "<bundle file>.json"
+#       - A graph is shown with <use xlink:href="charts.svg#chartN" />
+#
+import io       # for drawing a graph in memory
+import json     # for the manifest
+import os       # for the file names
+import sys      # for reporting errors
+
+import graphs
+import svg_writer
+
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".json"
+
+class BundledChart(object):
+  """
+    Writer backend mixin that draws a graph into its bundle instead of into
+    a standalone file
+  """
+  def write_header(self, width, height):
+    pass # the bundle writes the <symbol> tag around the graph
+
+  def write_footer(self):
+    pass
+
+  def define(self, element):
+    self.bundle.define(element)
+
+  def text(self):
+    """ Returns the drawn elements """
+    return self.out.getvalue()
+
+  def close(self):
+    super(BundledChart, self).close()
+    self.bundle.add_chart(self)
+
+class BundledStreamWriter(BundledChart, svg_writer.StreamWriter):
+  def __init__(self, output, size=None, bundle=None, **settings):
+    self.bundle = bundle
+    svg_writer.StreamWriter.__init__(self, output, size, **settings)
+
+class BundledCompactWriter(BundledChart, svg_writer.CompactWriter):
+  def __init__(self, output, size=None, bundle=None, **settings):
+    self.bundle = bundle
+    svg_writer.CompactWriter.__init__(self, output, size, **settings)
+    self.dots = bundle.dots # so the same dot is only defined once per bundle
+
+class BundledSvgwriteWriter(BundledChart, svg_writer.SvgwriteWriter):
+  def __init__(self, output, size=None, bundle=None, **settings):
+    self.bundle = bundle
+    svg_writer.SvgwriteWriter.__init__(self, output, size, **settings)
+
+  def text(self):
+    return self.output.getvalue()
+
+  def close(self):
+    for element in self.dwg.elements:
+      if element is not self.dwg.defs:
+        self.output.write(element.tostring())
+    self.bundle.add_chart(self)
+
+BUNDLED_WRITERS = {
+  "svgwrite" : BundledSvgwriteWriter,
+  "stream" : BundledStreamWriter,
+  "compact" : BundledCompactWriter,
+}
+
+class Bundle(object):
+  """
+    Single SVG file that the graphs are drawn into, one after another
+  """
+  def __init__(self, file_name, writer="stream", precision=None):
+    if writer not in BUNDLED_WRITERS:
+      raise ValueError("the %s writer backend can't be bundled" % writer)
+    self.file_name = file_name
+    self.writer = writer
+    self.precision = precision
+    self.dots = {} # (color, radius) -> id of the dots shared by the compact graphs
+    self.new_defs = [] # definitions made by the graph being drawn
+    self.chart = None # name, file name and size of the graph being drawn
+    self.charts = []
+    self.defs = []
+    self.offset = 0
+    self.out = open(file_name, "wb")
+    self.header = self.emit('<?xml version="1.0" encoding="utf-8" ?>\n'
+      '<svg baseProfile="full" height="100%%" version="1.1" width="100%%" %s>'
+      % svg_writer.SVG_NAMESPACES)
+
+  def emit(self, text):
+    """
+      Writes the given text and returns its [offset, length] in bytes
+    """
+    data = text.encode("utf-8")
+    self.out.write(data)
+    byte_range = [self.offset, len(data)]
+    self.offset += len(data)
+    return byte_range
+
+  def define(self, element):
+    self.new_defs.append(element)
+
+  def chart_id(self):
+    """
+      Returns the symbol id of the graph being drawn, which the ids inside
+      the graph are prefixed with so they stay unique in the bundle
+    """
+    return "chart" + str(len(self.charts))
+
+  def open_chart(self, name, file_name, size=None):
+    """
+      Returns a writer backend that draws the given group into the bundle
+      once it is closed
+    """
+    self.chart = (name, file_name, size)
+    return BUNDLED_WRITERS[self.writer](io.StringIO(), size, precision=self.precision, bundle=self)
+
+  def add_chart(self, writer):
+    """
+      Writes a drawn graph as a symbol, after the definitions it added
+    """
+    name, file_name, size = self.chart
+    if self.new_defs:
+      self.defs.append(self.emit("<defs>" + "".join(self.new_defs) + "</defs>"))
+      self.new_defs = []
+
+    chart_id = self.chart_id()
+    view_box = ""
+    if size is not None:
+      view_box = ' viewBox="0 0 %s %s"' % size
+    offset, length = self.emit('<symbol id="%s" overflow="visible"%s>%s</symbol>'
+      % (chart_id, view_box, writer.text()))
+    self.charts.append({
+      "name" : name,
+      "id" : chart_id,
+      "file" : file_name,
+      "offset" : offset,
+      "length" : length,
+    })
+
+  def close(self):
+    """
+      Finishes the bundle and writes its manifest
+    """
+    footer = self.emit("</svg>")
+    self.out.close()
+    manifest = {
+      "version" : MANIFEST_VERSION,
+      "file" : os.path.basename(self.file_name),
+      "header" : self.header,
+      "defs" : self.defs,
+      "footer" : footer,
+      "charts" : self.charts,
+    }
+    with open(manifest_file_name(self.file_name), "w") as manifest_output:
+      json.dump(manifest, manifest_output, indent=1)
+      manifest_output.write("\n")
+
+def manifest_file_name(file_name):
+  """
+    Returns the name of the manifest of the given bundle
+  """
+  return file_name + MANIFEST_SUFFIX
+
+def load_manifest(file_name):
+  """
+    Returns the manifest of the given bundle
+  """
+  with open(manifest_file_name(file_name), "r") as manifest_input:
+    return json.load(manifest_input)
+
+def extract_chart(file_name, name):
+  """
+    Cuts the graph with the given group name (or symbol id) out of the given
+    bundle, using the byte ranges of its manifest.
+    Returns a standalone SVG document, as bytes.
+  """
+  manifest = load_manifest(file_name)
+  for chart in manifest["charts"]:
+    if chart["name"] == name or chart["id"] == name:
+      break
+  else:
+    raise LookupError("No group named " + name + " in " + file_name)
+
+  parts = []
+  with open(file_name, "rb") as bundle_input:
+    for offset, length in [manifest["header"]] + manifest["defs"] + [[chart["offset"], chart["length"]]]:
+      bundle_input.seek(offset)
+      parts.append(bundle_input.read(length))
+  parts.append(b'<use xlink:href="#' + chart["id"].encode("utf-8") + b'" /></svg>')
+  return b"".join(parts)
+
+def bundle_groups(groups, file_name, options=None):
+  """
+    Draws the given groups into a single bundle file.
+    A group that fails is reported and left out of the bundle.
+    Returns a [group name, symbol id, error] list for each group.
+  """
+  options = graphs.render_options(options)
+  bundle = Bundle(file_name, options["writer"], options["precision"])
+  options["bundle"] = bundle
+  results = []
+  try:
+    for dataset in groups:
+      name = dataset.config["filename"]
+      charts = len(bundle.charts)
+      dots = dict(bundle.dots)
+      try:
+        graphs.draw_rect_graph(dataset, options)
+      except Exception as error:
+        error = "%s: %s" % (type(error).__name__, error)
+        print("Failed to render", name + ":", error, file=sys.stderr)
+        # The definitions of a failed graph are dropped with it
+        bundle.new_defs = []
+        bundle.dots.clear()
+        bundle.dots.update(dots)
+        results.append([name, None, error])
+        continue
+      results.append([name, bundle.charts[charts]["id"], None])
+  finally:
+    bundle.close()
+  return results
+
+def main(argv=None):
+  """
+    Command line interface: writes a single graph of a bundle to stdout
+  """
+  import argparse
+  parser = argparse.ArgumentParser(description="Cuts a graph out of an SVG bundle")
+  parser.add_argument("bundle_file", help="bundle written by graphs.py --bundle")
+  parser.add_argument("name", help="group name or symbol id of the graph")
+  args = parser.parse_args(argv)
+  try:
+    sys.stdout.buffer.write(extract_chart(args.bundle_file, args.name))
+  except LookupError as error:
+    print(error, file=sys.stderr)
+    return 1
+  return 0
+
+if __name__ == "__main__":
+  exit(main())
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# chart_templates.py
+# Last Updated:
+# Purpose: Draws rectangle graphs by filling in a precompiled SVG skeleton.
+#          Groups with the same config (apart from the file name) and the
+#          same number and lengths of series draw the same elements at the
+#          same x positions, so everything but the colors and heights is
+#          formatted once per shape. Each group is then just a % format of
+#          its numbers into the skeleton.
+# Notes:
+#       - The output is the same as the stream (and svgwrite) writer
+#       - Only used for plain graphs: not with line budgets, bar binning,
+#         dot density limits, bundles or profiling, which draw differently
+#
+import svg_writer
+
+# Skeletons kept in memory, the oldest one is dropped first
+MAX_TEMPLATES = 64
+
+TEMPLATES = {}
+
+def can_template(options):
+  """
+    Checks if the graphs drawn with the given options can use templates
+  """
+  return options["writer"] in ("stream", "svgwrite") and not options["line_budget"] \
+    and not options["bar_width"] and not options["dot_density"] \
+    and options["bundle"] is None and options["profile"] is None
+
+def shape_of(dataset):
+  """
+    Returns what has to match for two groups to share a template
+  """
+  config = tuple(sorted((key, value) for key, value in dataset.config.items() if key != "filename"))
+  return (config, tuple(len(values) for values in dataset.series))
+
+class Template(object):
+  """
+    Skeleton of every rectangle graph with the same shape.
+    Each section is the format string of one series' rects, line or dots,
+    with %s in place of its colors and numbers.
+  """
+  def __init__(self, config, lengths):
+    # x of every value, added up the same way draw_rect_graph() does
+    x_positions = []
+    x_index = 0
+    for index in range(0, max(lengths, default=0)):
+      x_positions.append(str(x_index))
+      x_index += config["rect_width"]
+
+    self.sections = [] # [kind, series index, offset, format]
+    v_offset_origin = config["v_offset"]
+    if config["show_rect"] == "true":
+      width = str(config["rect_width"])
+      for group_index in range(1, len(lengths)):
+        fmt = "".join(['<rect fill="%%s" height="%%s" width="%s" x="%s" y="%%s" />'
+          % (width, x_positions[list_index - 1]) for list_index in range(1, lengths[group_index])])
+        self.sections.append(["rect", group_index, v_offset_origin, fmt])
+        v_offset_origin += config["v_offset"]
+
+    if config["show_line"] == "true":
+      line_v_offset = v_offset_origin
+      stroke_width = str(config["st_width"])
+      for group_index in range(0, len(lengths)):
+        fmt = '<path d="M' + ", ".join([x_positions[index] + ",%s" for index in range(0, lengths[group_index])]) \
+          + '" fill="none" stroke="%%s" stroke-width="%s" />' % stroke_width
+        self.sections.append(["line", group_index, v_offset_origin, fmt])
+        v_offset_origin += line_v_offset
+
+      v_offset_origin = line_v_offset
+      dot_radius = str(config["dot_radius"])
+      for group_index in range(0, len(lengths)):
+        fmt = "".join(['<circle cx="%s" cy="%%s" fill="%%s" r="%s" />' % (x_positions[index], dot_radius)
+          for index in range(0, lengths[group_index])])
+        self.sections.append(["dot", group_index, v_offset_origin, fmt])
+        v_offset_origin += line_v_offset
+
+  def render(self, dataset):
+    """
+      Returns the SVG text of the given group
+    """
+    text = []
+    colors = {}
+    for kind, group_index, offset, fmt in self.sections:
+      height_list = dataset.series[group_index]
+      color = dataset.colors[group_index]
+      if color not in colors:
+        colors[color] = svg_writer.escape_attribute(str(color))
+      color = colors[color]
+
+      if kind == "rect":
+        args = []
+        for r_size in height_list[1:]:
+          args += (color, r_size, -r_size + offset)
+      elif kind == "line":
+        args = [-r_size + offset for r_size in height_list]
+        args.append(color)
+      else:
+        args = []
+        for r_size in height_list:
+          args += (-r_size + offset, color)
+      text.append(fmt % tuple(args))
+    return "".join(text)
+
+def template_of(dataset):
+  """
+    Returns the template of the given group, compiling it the first time
+    its shape is seen
+  """
+  shape = shape_of(dataset)
+  template = TEMPLATES.get(shape)
+  if template is None:
+    if len(TEMPLATES) >= MAX_TEMPLATES:
+      del TEMPLATES[next(iter(TEMPLATES))]
+    template = TEMPLATES[shape] = Template(dataset.config, shape[1])
+  return template
+
+def draw_template_graph(dataset, output):
+  """
+    Draws the given rectangle graph into the given file name or file object
+  """
+  text = template_of(dataset).render(dataset)
+  out, owns_output = svg_writer.open_output(output)
+  out.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+  out.write('<svg baseProfile="full" height="100%%" version="1.1" width="100%%" %s><defs />'
+    % svg_writer.SVG_NAMESPACES)
+  out.write(text)
+  out.write("</svg>")
+  if owns_output:
+    out.close()
+  else:
+    out.flush()
@@ -11,6 +11,7 @@
 #
 import math # for the trig functions
 import svgwrite # for making the svg's
+from slice_geometry import slice_geometry # for the slice degrees
 
 ## Config
 
@@ -53,30 +54,6 @@ def anglept(angle=0):
   point=[x_point + center_offset, y_point + center_offset]
   return point
 
-def num_to_degree(index=0, list_given=None):
-  """
-    Calculates the degrees of 360° from the total of the given list
-    Note: Degree is cumulative, and if the degree is over 180°, the function
-          will split the degree into two parts (180° + the remainder)
-          Eg: index=1 will have the degree of 360° of index=0 + index=1
-  """
-  if list_given == None:
-    print("num_to_percent wasn't given a list")
-    exit(1)
-  total = 0
-  divisor = 0
-  for num in range(0,len(list_given)):
-    total += list_given[num] # add all the list numbers
-    if num <= index:
-      divisor += list_given[num] # get the sum up to the index given
-
-  # Check if the current number is over 50%
-  isOverHalf = False
-  numerator = list_given[index]
-  if round((numerator / total)*100) > 50:
-    isOverHalf = True
-  return [isOverHalf, round((divisor / total)*360)]
-
 def draw_out():
   name="circle" # we need a name for the graph, tho it doesn't matter what it is
   dwg = svgwrite.Drawing(filename=file_name, size=(175,175))
@@ -93,28 +70,32 @@ def draw_out():
   else:
     line_stroke_w = 18
 
+  # Work out every slice at once instead of re-adding the list per slice
+  slices = slice_geometry(graph_numbers)
+
   last_angle_used = 0
   # Look thru all the numbers in the list and graph them out!
   for index in range(0, len(graph_numbers)):
     split = 1
+    isOverHalf, degree, percentage = slices[index]
 
     # Set the slice color  
     fill_color = graph_colors[index]
 
     # Check if we need to split the slice to 2 pieces (if slice is over 180°)
-    if num_to_degree(index, graph_numbers)[0]:
+    if isOverHalf:
       split = 2
 
     # Create the slice points
     if index == 0 and index != len(graph_numbers):
       # start the first slice at 0
       start_angle = last_angle_used
-      end_angle = num_to_degree(index, graph_numbers)[1] / split
+      end_angle = degree / split
       #print("a first slice", start_angle, end_angle)
     elif index != len(graph_numbers):
       # Start at the last slice calculated
       start_angle = last_angle_used
-      end_angle = num_to_degree(index, graph_numbers)[1] / split
+      end_angle = degree / split
       #print("a followed slice", start_angle, end_angle)
     else:
       start_angle = 0
@@ -128,12 +109,9 @@ def draw_out():
       addArc(dwg, current_group, p0=anglept(end_angle), p1=anglept(start_angle), radius=circle_size, f_color=fill_color, line_stroke_width=line_stroke_w)
       # Then update to the second half of the slice
       start_angle = end_angle
-      end_angle = num_to_degree(index, graph_numbers)[1]
+      end_angle = degree
 
     # Print the % of what the slice takes up.
-    percentage = round(num_to_degree(index, graph_numbers)[1]/3.6)
-    if index != 0:
-      percentage = percentage - round(num_to_degree(index-1, graph_numbers)[1]/3.6)
     print(index+1, ':', percentage, '%')
 
     # Draw the slice
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# csv_values.py
+# Last Updated:
+# Purpose: Turns the number columns of a csv row into an array of floats,
+#          converting the whole row at once instead of one value at a time.
+# Notes:
+#       - Uses NumPy for long rows when it is installed (imported lazily)
+#       - The values are the same with or without NumPy
+#       - Empty cells (eg: the padding of spreadsheet exports) are skipped
+#
+from array import array
+
+from optional_numpy import load_numpy
+
+# Below this many values the plain conversion is faster than setting up NumPy
+NUMPY_MIN_VALUES = 64
+
+def trim_blanks(fields):
+  """
+    Returns the given fields without the empty ones, in a single pass
+  """
+  if "" not in fields:
+    return fields
+  return [field for field in fields if field]
+
+def parse_values(fields):
+  """
+    Returns the non empty fields of the given row as an array('d').
+    Raises ValueError if a field isn't a number, like float() does.
+  """
+  fields = trim_blanks(fields)
+  values = array("d")
+  numpy = len(fields) >= NUMPY_MIN_VALUES and load_numpy()
+  if numpy:
+    values.frombytes(numpy.array(fields, dtype=numpy.float64).tobytes())
+  else:
+    values.extend(map(float, fields))
+  return values
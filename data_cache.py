@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# data_cache.py
+# Last Updated:
+# Purpose: Keeps the parsed groups of a CSV file in a binary sidecar file, so
+#          rendering an unchanged file again doesn't parse any text.
+#          The sidecar is written while the groups are parsed the first time,
+#          then memory-mapped when it is read back, so the series are read
+#          straight from the page cache instead of being copied.
+# Notes:
+#       - The sidecar is saved next to the CSV file as "<csv file>.parsed"
+#       - The sidecar is only used while the CSV file size and mtime match
+#       - Layout: the magic bytes, the float64 values of every series one after
+#         another, a JSON footer with the configs, colors and where each series
+#         starts, then the footer offset (8 bytes) and the magic bytes again
+#
+from array import array
+import json     # for the footer
+import mmap     # for reading the values in place
+import os       # for file checking
+import struct   # for the footer offset
+import sys      # for the byte order
+
+from dataset import Dataset, UnreadGroup
+
+DATA_VERSION = 1
+DATA_SUFFIX = ".parsed"
+MAGIC = b"GRAPHDAT"
+TRAILER = struct.Struct("<Q8s") # footer offset, magic
+
+def data_file_name(file_name):
+  """
+    Returns the name of the parsed data sidecar of the given csv file
+  """
+  return file_name + DATA_SUFFIX
+
+def file_key(file_name):
+  """
+    Returns what the sidecar of the given csv file has to match to be used
+  """
+  stat = os.stat(file_name)
+  return {
+    "version" : DATA_VERSION,
+    "path" : os.path.abspath(file_name),
+    "size" : stat.st_size,
+    "mtime_ns" : stat.st_mtime_ns,
+    "byteorder" : sys.byteorder,
+  }
+
+def load_groups(file_name):
+  """
+    Returns the Datasets of the given csv file from its sidecar, or None if
+    there is no sidecar or it is out of date.
+    The series are memoryviews into the mapped sidecar.
+  """
+  try:
+    with open(data_file_name(file_name), "rb") as data_input:
+      data = mmap.mmap(data_input.fileno(), 0, access=mmap.ACCESS_READ)
+  except (OSError, ValueError): # missing or empty sidecar
+    return None
+
+  try:
+    if len(data) < len(MAGIC) + TRAILER.size or data[:len(MAGIC)] != MAGIC:
+      return None
+    footer_offset, magic = TRAILER.unpack_from(data, len(data) - TRAILER.size)
+    if magic != MAGIC:
+      return None # not finished writing
+    footer = json.loads(data[footer_offset:len(data) - TRAILER.size].decode("utf-8"))
+    if footer["key"] != file_key(file_name):
+      return None
+  except (OSError, ValueError, KeyError, struct.error):
+    return None # broken sidecar, so just parse the csv file again
+
+  values = memoryview(data)
+  datasets = []
+  for group in footer["groups"]:
+    series = []
+    for start, count in group["series"]:
+      series.append(values[start:start + count * 8].cast("d"))
+    datasets.append(Dataset(group["config"], group["colors"], series))
+  return datasets
+
+def cached_groups(file_name, datasets):
+  """
+    Yields the given datasets (parsed from the given csv file) and writes
+    them to the sidecar on the way. The sidecar is only put in place once
+    every group went through, so a run that stops early leaves no sidecar.
+    Neither does a file with a group that couldn't be parsed, so its error
+    is reported again on the next run.
+  """
+  key = file_key(file_name)
+  sidecar = data_file_name(file_name)
+  temp_name = "%s.%d.tmp" % (sidecar, os.getpid())
+  groups = []
+  unread = False
+  try:
+    data_output = open(temp_name, "wb")
+  except OSError:
+    # The sidecar is only a speedup, so a read-only directory is fine
+    yield from datasets
+    return
+
+  try:
+    with data_output:
+      data_output.write(MAGIC)
+      offset = len(MAGIC)
+      for dataset in datasets:
+        if isinstance(dataset, UnreadGroup):
+          unread = True
+          yield dataset
+          continue
+        series = []
+        for values in dataset.series:
+          if not isinstance(values, array):
+            values = array("d", values)
+          values.tofile(data_output)
+          series.append([offset, len(values)])
+          offset += len(values) * values.itemsize
+        groups.append({"config" : dataset.config, "colors" : dataset.colors, "series" : series})
+        yield dataset
+
+      footer = json.dumps({"key" : key, "groups" : groups}).encode("utf-8")
+      data_output.write(footer)
+      data_output.write(TRAILER.pack(offset, MAGIC))
+    if not unread and file_key(file_name) == key: # don't keep it if the csv file changed meanwhile
+      os.replace(temp_name, sidecar)
+  finally:
+    if os.path.exists(temp_name):
+      os.remove(temp_name)
+
+def read_cached_groups(file_name, read_groups):
+  """
+    Yields every group of the given csv file, from the sidecar when it is
+    up to date, otherwise by parsing it with read_groups(file_name) and
+    saving the sidecar for the next time
+  """
+  datasets = load_groups(file_name)
+  if datasets is not None:
+    yield from datasets
+  else:
+    yield from cached_groups(file_name, read_groups(file_name))
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# dataset.py
+# Last Updated:
+# Purpose: Compact in-memory form of a parsed group.
+# Notes:
+#       - The values of every series are packed in an array('d'), which takes
+#         8 bytes per point instead of a list of Python floats
+#       - The colors are kept in a list next to the series, so colors[n] is
+#         the color of series[n]
+#       - Series loaded from the parsed data sidecar are memoryviews of
+#         doubles instead, which read the same way
+#       - Groups drawn row by row (see stream_render.py) are a StreamedGroup,
+#         which only says where the rows are
+#       - Groups that couldn't be parsed are an UnreadGroup, so the error is
+#         reported for that group alone
+#
+from array import array
+
+class Dataset(object):
+  """
+    The configuration, series colors and series values of one group
+  """
+  __slots__ = ("config", "colors", "series")
+
+  def __init__(self, config, colors=None, series=None):
+    self.config = config
+    self.colors = colors if colors is not None else []
+    self.series = series if series is not None else []
+
+  def add_series(self, color, values):
+    """
+      Adds a series with the given color and numbers
+    """
+    if not isinstance(values, array):
+      values = array("d", values)
+    self.colors.append(color)
+    self.series.append(values)
+
+  def __len__(self):
+    return len(self.series)
+
+  def __reduce__(self):
+    # The series can be memoryviews into a mapped sidecar file (see
+    # data_cache.py), which can't be pickled, so send them as arrays
+    series = []
+    for values in self.series:
+      if not isinstance(values, array):
+        view, values = values, array("d")
+        values.frombytes(view.cast("B"))
+      series.append(values)
+    return (Dataset, (self.config, self.colors, series))
+
+  def __repr__(self):
+    return "Dataset(%r, %d series)" % (self.config.get("filename"), len(self.series))
+
+  def to_json(self):
+    """
+      Returns the dataset as plain JSON serializable lists and dictionaries
+    """
+    return {
+      "config" : self.config,
+      "colors" : self.colors,
+      "series" : [values.tolist() for values in self.series],
+    }
+
+class StreamedGroup(object):
+  """
+    A group too big to load, which is drawn straight from its rows in the
+    csv file (see stream_render.py). Only its configuration and its group
+    index entry are kept.
+  """
+  __slots__ = ("config", "csv_file", "entry")
+
+  def __init__(self, config, csv_file, entry):
+    self.config = config
+    self.csv_file = csv_file
+    self.entry = entry
+
+  def __len__(self):
+    return self.entry["rows"]
+
+  def __repr__(self):
+    return "StreamedGroup(%r, %d points)" % (self.config.get("filename"), self.entry["points"])
+
+  def to_json(self):
+    """
+      Returns the configuration and a digest of the rows, which stand in for
+      the series in the render cache key
+    """
+    import group_index
+    return {
+      "config" : self.config,
+      "sha256" : group_index.group_digest(self.csv_file, self.entry),
+    }
+
+class UnreadGroup(object):
+  """
+    A group that couldn't be parsed (eg: a number that isn't one). Only its
+    header and the parse error are kept, and drawing it raises the error.
+  """
+  __slots__ = ("config", "error")
+
+  def __init__(self, config, error):
+    self.config = config
+    self.error = error
+
+  def __len__(self):
+    return 0
+
+  def __repr__(self):
+    return "UnreadGroup(%r, %r)" % (self.config.get("filename"), str(self.error))
+
+  def to_json(self):
+    """
+      Returns the configuration and the error, which stand in for the series
+      in the render cache key (a failed group is never stored)
+    """
+    return {
+      "config" : self.config,
+      "error" : "%s: %s" % (type(self.error).__name__, self.error),
+    }
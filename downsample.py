@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# downsample.py
+# Last Updated:
+# Purpose: Picks which points of a long series are worth drawing, so line
+#          graphs with a huge number of points stay small.
+#          - lttb: Largest-Triangle-Three-Buckets, keeps the visual shape
+#          - minmax: keeps the lowest and highest point of every bucket
+#          Long bar series are binned instead (see bin_bars()), so there is
+#          one bar per bin rather than one per value.
+# Notes:
+#       - The line downsamplers return the indexes of the points to keep, in order
+#       - The points are assumed to be evenly spaced along x
+#
+def lttb(values, budget):
+  """
+    Returns the indexes of at most `budget` points picked with the
+    Largest-Triangle-Three-Buckets algorithm.
+    The first and last points are always kept.
+  """
+  count = len(values)
+  if budget >= count:
+    return list(range(count))
+  if budget < 3:
+    return [0, count - 1][:max(budget, 0)]
+
+  indexes = [0]
+  bucket_size = (count - 2) / (budget - 2)
+  last_index = 0
+  for bucket in range(0, budget - 2):
+    start = int(bucket * bucket_size) + 1
+    end = int((bucket + 1) * bucket_size) + 1
+
+    # Average point of the next bucket (the last point for the last bucket)
+    next_start = end
+    next_end = min(int((bucket + 2) * bucket_size) + 1, count)
+    if bucket == budget - 3 or next_start >= next_end:
+      average_x = count - 1
+      average_y = values[count - 1]
+    else:
+      average_x = (next_start + next_end - 1) / 2
+      average_y = sum(values[next_start:next_end]) / (next_end - next_start)
+
+    # Keep the point making the biggest triangle with the last kept point
+    # and the average of the next bucket
+    last_x = last_index
+    last_y = values[last_index]
+    best_index = start
+    best_area = -1
+    for index in range(start, end):
+      area = abs((last_x - average_x) * (values[index] - last_y) -
+        (last_x - index) * (average_y - last_y))
+      if area > best_area:
+        best_area = area
+        best_index = index
+    indexes.append(best_index)
+    last_index = best_index
+
+  indexes.append(count - 1)
+  return indexes
+
+def minmax(values, budget):
+  """
+    Returns the indexes of at most `budget` points, keeping the lowest and
+    the highest point of budget/2 evenly sized buckets.
+  """
+  count = len(values)
+  if budget >= count:
+    return list(range(count))
+  if budget < 2:
+    return [0][:max(budget, 0)]
+  buckets = budget // 2
+
+  indexes = []
+  bucket_size = count / buckets
+  for bucket in range(0, buckets):
+    start = int(bucket * bucket_size)
+    end = int((bucket + 1) * bucket_size)
+    if start >= end:
+      continue
+    low = high = start
+    for index in range(start + 1, end):
+      if values[index] < values[low]:
+        low = index
+      elif values[index] > values[high]:
+        high = index
+    # Keep the two points in the order they were in
+    indexes.append(min(low, high))
+    if low != high:
+      indexes.append(max(low, high))
+  return indexes
+
+DOWNSAMPLERS = {
+  "lttb" : lttb,
+  "minmax" : minmax,
+}
+
+BAR_AGGREGATES = ("max", "mean", "range")
+
+def bin_bars(values, bins, aggregate="max"):
+  """
+    Splits the values into at most `bins` evenly sized runs of consecutive
+    values and returns a [start, end, low, high] list for each run, where
+    the bar of the run goes from low up to high:
+      - max: from 0 to the highest value
+      - mean: from 0 to the average value
+      - range: from the lowest to the highest value
+  """
+  count = len(values)
+  bins = max(min(bins, count), 1)
+  bin_size = count / bins
+
+  bars = []
+  for bin_index in range(0, bins):
+    start = int(bin_index * bin_size)
+    end = int((bin_index + 1) * bin_size)
+    if start >= end:
+      continue
+    run = values[start:end]
+    if aggregate == "max":
+      bars.append([start, end, 0, max(run)])
+    elif aggregate == "mean":
+      bars.append([start, end, 0, sum(run) / (end - start)])
+    elif aggregate == "range":
+      bars.append([start, end, min(run), max(run)])
+    else:
+      raise ValueError("unknown bar aggregate: " + str(aggregate))
+  return bars
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# generate_csv.py
+# Last Updated:
+# Purpose: Writes a synthetic CSV file in the layout graphs.py reads (see
+#          README.md), for benchmarking and testing with big inputs.
+# Program Uses: ./generate_csv.py out.csv --groups 100 --rows 5 --points 1000
+# Notes:
+#       - The same seed always gives the same file
+#
+import argparse # for the command line options
+import random   # for the made up numbers
+
+LEGEND = "file name/color,mode,Rectangle width/donut thickness,offset,line width," \
+  "dot size,show rectangle/make donut,show line"
+
+COLORS = ["#811412", "yellow", "cyan", "green", "#ccc", "#048080", "orange",
+  "black", "red", "blue", "purple", "violet", "pink", "#cdab8f"]
+
+def generate_csv(file_name, groups=10, rows=5, points=100, circle_ratio=0.2,
+    padding=0, seed=0):
+  """
+    Writes a csv file with the given number of groups, rows per group and
+    points per row. circle_ratio is the share of groups that are pie/donut
+    (c) graphs, which always have one number per row. padding adds that many
+    empty columns at the end of every row, like spreadsheet exports do.
+    Returns the total number of points written.
+  """
+  rng = random.Random(seed)
+  pad = "," * padding
+  total_points = 0
+  with open(file_name, "w") as csv_output:
+    csv_output.write(LEGEND + pad + "\n")
+    for group in range(0, groups):
+      if rng.random() < circle_ratio:
+        donut = rng.choice(["TRUE", "FALSE"])
+        csv_output.write("circle_%d,c,18,,,,%s,%s\n" % (group, donut, pad))
+        for row in range(0, rows):
+          csv_output.write("%s,%d%s\n" % (COLORS[row % len(COLORS)], rng.randint(1, 1000), pad))
+        total_points += rows
+        continue
+
+      show_rect = rng.choice(["TRUE", "FALSE"])
+      csv_output.write("rect_%d,r,%s,%d,1,2.5,%s,TRUE%s\n"
+        % (group, rng.choice(["80", "12.5", "1", "0.25"]), rng.choice([0, 100]), show_rect, pad))
+      for row in range(0, rows):
+        values = ",".join(["%.1f" % rng.uniform(0, 100) for point in range(0, points)])
+        csv_output.write("%s,%s%s\n" % (COLORS[row % len(COLORS)], values, pad))
+      total_points += rows * points
+  return total_points
+
+def main(argv=None):
+  """
+    Command line interface
+  """
+  parser = argparse.ArgumentParser(description="Writes a synthetic graphs.py CSV file")
+  parser.add_argument("csv_file", help="CSV file to write")
+  parser.add_argument("--groups", type=int, default=10, help="number of groups")
+  parser.add_argument("--rows", type=int, default=5, help="rows (series) per group")
+  parser.add_argument("--points", type=int, default=100, help="points per row of the r groups")
+  parser.add_argument("--circle-ratio", type=float, default=0.2,
+    help="share of the groups that are pie/donut graphs")
+  parser.add_argument("--padding", type=int, default=0,
+    help="empty columns added at the end of every row")
+  parser.add_argument("--seed", type=int, default=0, help="random seed")
+  args = parser.parse_args(argv)
+
+  total_points = generate_csv(args.csv_file, args.groups, args.rows, args.points,
+    args.circle_ratio, args.padding, args.seed)
+  print("Wrote", total_points, "points to", args.csv_file)
+  return 0
+
+if __name__ == "__main__":
+  exit(main())
@@ -6,134 +6,183 @@
 # Last Updated: 
 # Purpose: Creates line or bar graph(s) or donut graphs with the given data
 #          points given within a CSV file.
-# Program Uses: ./graphs.py
+# Program Uses: ./graphs.py [csv file] [options]
+#               or: import graphs; graphs.render_csv("data.csv", "out_dir")
 # Notes: 
-#       - Requires svgwrite python module
+#       - Requires svgwrite python module (unless --writer stream is used)
 #       - Requires a scecifically formatted csv file.
 #
-import svgwrite
+import contextlib # for the profiling stages
+import csv      # for reading the rows
+import io       # for reading stdin
 import math     # for the trig functions
 import os       # for file checking
-
-# breaking `with` using `with`
-# https://stackoverflow.com/a/23665658
-class fragile(object):
-  class Break(Exception):
-    """Break out of the with statement"""
-
-  def __init__(self, value):
-    self.value = value
-
-  def __enter__(self):
-    return self.value.__enter__()
-
-  def __exit__(self, etype, value, traceback):
-    error = self.value.__exit__(etype, value, traceback)
-    if etype == self.Break:
-      return True
-    return error
-
-def header_count(file_name):
+import sys      # for reporting errors
+import group_index # for rendering a single group
+from slice_geometry import slice_geometry, coalesce_slices # for the pie/donut slices
+import svg_writer # for the svgwrite/stream writer backends
+import downsample # for lines with too many points
+import chart_templates # for drawing groups of the same shape quickly
+from csv_values import parse_values # for the number columns
+from dataset import Dataset, StreamedGroup, UnreadGroup # for holding the parsed groups
+
+# Options that are not part of the csv file
+DEFAULT_OPTIONS = {
+  "writer" : "svgwrite", # svg_writer backend used to write the graphs
+  "line_budget" : None, # most points drawn per line, None to draw them all
+  "downsample" : "lttb", # how the line points are picked: lttb or minmax
+  "dot_density" : None, # most dots per unit along x before they're left out
+  "bar_width" : None, # most bars per series (the output width in pixels), None for all
+  "bar_aggregate" : "max", # how binned bars are drawn: max, mean or range
+  "min_slice" : None, # slices under this % are merged into an "other" slice
+  "top_slices" : None, # most slices drawn, the rest are merged into "other"
+  "other_color" : "gray", # color of the "other" slice
+  "slice_table" : False, # write the slice %s to a csv file instead of printing them
+  "templates" : False, # draw the plain rectangle graphs from precompiled templates
+  "tile_points" : None, # points per tile of long graphs (see tiles.py), None to not tile
+  "tile_aggregate" : "max", # how the tile levels bin their points: max or mean
+  "stream_points" : None, # groups with more points are drawn row by row (see stream_render.py)
+  "precision" : svg_writer.DEFAULT_PRECISION, # decimals kept by the compact writer
+  "svgz" : False, # gzip the graphs into .svgz files
+  "profile" : None, # profiling.GroupProfile of the group, set by the renderer
+  "output" : None, # file object to draw into instead of the graph file
+  "bundle" : None, # bundle.Bundle to draw into instead of the graph file
+}
+
+def parse_config(c_line_content):
+  """
+    Returns the graph configuration of the given group header row
+  """
+  # A rectangle header goes up to "show line", a circle one to "make donut"
+  columns = 8 if c_line_content[1] == "r" else 7
+  if len(c_line_content) < columns:
+    raise ValueError("the header of %s has %d of its %d columns"
+      % (c_line_content[0], len(c_line_content), columns))
+  if c_line_content[1] == "r":
+    return {
+      "filename" : c_line_content[0],
+      "draw_mode" : c_line_content[1].lower(),
+      "rect_width" : float(c_line_content[2]),
+      "v_offset" : float(c_line_content[3]),
+      "st_width" : float(c_line_content[4]),
+      "dot_radius" : float(c_line_content[5]),
+      "show_rect" : c_line_content[6].lower(),
+      "show_line" : c_line_content[7].lower(),
+    }
+  # Otherwise the config is for circles
+  return {
+    "filename" : c_line_content[0],
+    "draw_mode" : c_line_content[1].lower(),
+    "line_stroke_width" : c_line_content[2],
+    "make_donut" : c_line_content[6].lower(),
+  }
+
+def parse_groups(csv_lines):
   """
-    returns the number of headers in a file
+    Parses the given csv lines and yields a Dataset for every group as soon
+    as the group is complete.
+    Each line is only read once, so parsing is linear in the file size.
+    Quoted fields (eg: a group name with a comma in it) are read like
+    spreadsheets write them.
+    A group with a header or number that can't be read is yielded as an
+    UnreadGroup, so the groups after it are still parsed.
   """
-  count = 0
-  with fragile(open(file_name, "r")) as file_input:
-    for line in file_input:
-      c_line_content = line.rstrip("\n").split(",")
+  dataset = None
+  for c_line_content in csv.reader(csv_lines):
+    # Skip the lines that can't hold a mode or any data
+    if len(c_line_content) < 2:
+      continue
+
+    # Check if this is the start of a set of data using config information
+    if (c_line_content[1] == "r") or (c_line_content[1] == "c"):
+      # Hand over the previous dataset before starting the next one
+      if dataset is not None:
+        yield dataset
+      try:
+        dataset = Dataset(parse_config(c_line_content))
+      except ValueError as error:
+        dataset = UnreadGroup({"filename" : c_line_content[0], "draw_mode" : c_line_content[1]}, error)
+
+    # Add the rest of the data below the config line (the rest of an unread
+    # group is skipped)
+    elif isinstance(dataset, Dataset):
+      # The first column is the color of the bars, then the bar heights
+      # (without the blanks)
+      try:
+        dataset.add_series(c_line_content[0], parse_values(c_line_content[1:]))
+      except ValueError as error:
+        dataset = UnreadGroup(dataset.config, error)
+
+  if dataset is not None:
+    yield dataset
+
+def read_groups(file_name):
+  """
+    Opens the given csv file once and yields every group within it.
+    The first line is kept as a legend, so it is skipped.
+  """
+  with open(file_name, "r", newline="") as csv_input:
+    yield from stream_groups(csv_input)
 
-      # Check if this is the start of a set of data using config information
-      if (c_line_content[1] == "r") or (c_line_content[1] == "c"):
-        count += 1
+def stream_groups(csv_input):
+  """
+    Yields every group of the given open csv file (eg: stdin), skipping the
+    first line like read_groups() does
+  """
+  next(csv.reader(csv_input), None) # skip the first row
+  yield from parse_groups(csv_input)
 
-  # subtract from one because we don't want to go past the last header
-  count -= 1
-  return count
+def open_group_writer(config, options, size=None):
+  """
+    Opens the writer backend for the given group, counting what goes
+    through it when the group is profiled
+  """
+  output = options["output"]
+  if output is None:
+    output = output_name(config, options)
+  if options["bundle"] is not None:
+    writer = options["bundle"].open_chart(config["filename"], output_name(config, options), size)
+  else:
+    writer = svg_writer.open_writer(options["writer"], output, size=size,
+      precision=options["precision"])
+  if options["profile"] is not None:
+    writer = options["profile"].wrap_writer(writer, output)
+  return writer
+
+def profile_stage(options, stage_name):
+  """
+    Times the with block as the given stage, when the group is profiled
+  """
+  if options["profile"] is None:
+    return contextlib.nullcontext()
+  return options["profile"].stage(stage_name)
 
-def dict_to_list(dictionary_in):
+def line_points_of(height_list, config, options):
   """
-    Converts the given dictionary to two separate lists
+    Returns the [x, height] of every point on the line of the given series,
+    downsampled to the line budget when the series is longer than it
   """
-  item_list = []
-  for key, value in dictionary_in.items():
-    if type(value) is not list:
-      item_list.append(value)
-    else:
-      item_list.append(value[0])
-  return item_list
-
-def conf_graph(line_buffer):
-  """
-    Parses the given csv file and returns the configuration and colors.
-    Will skip to whatever line number given, excluding the initial line.
-  """
-  config = {}
-  height_dictionary = {}
-  color_dictionary = {}
-  # Open the csv file
-  with fragile(open(csv_file, "r")) as csv_input:
-    csv_input.readline() # skip the first line
-
-    # skip through the lines that have already been read.
-    if line_buffer != 0:
-      for num in range(0, line_buffer):
-        csv_input.readline()
-
-    # read through the line contents
-    c_line_content = ""
-    line_count = 0 # keep track of the number of lines read
-    for csv_line in csv_input:
-      c_line_content = csv_line.rstrip("\n").split(",")
-
-      # Check if this is the start of a set of data using config information
-      if c_line_content[1] == "r" and line_count == 0:
-        config = {
-          "filename" : c_line_content[0],
-          "draw_mode" : c_line_content[1].lower(),
-          "rect_width" : float(c_line_content[2]),
-          "v_offset" : float(c_line_content[3]),
-          "st_width" : float(c_line_content[4]),
-          "dot_radius" : float(c_line_content[5]),
-          "show_rect" : c_line_content[6].lower(),
-          "show_line" : c_line_content[7].lower(),
-        }
-      # Check if the config is for circles
-      elif c_line_content[1] == "c" and line_count == 0:
-        config = {
-          "filename" : c_line_content[0],
-          "draw_mode" : c_line_content[1].lower(),
-          "line_stroke_width" : c_line_content[2],
-          "make_donut" : c_line_content[6].lower(),
-        }
-
-      # Add the rest of the data below the config line (r)
-      elif (c_line_content[1] != "r" and c_line_content[1] != "c") and \
-          line_count != 0:
-        # Set the color of the bars
-        c_name = "color_" + str(line_count - 1)
-        color_dictionary[c_name] = c_line_content[0]
-
-        # Then set the bar heights
-        h_name = "height_list_" + str(line_count - 1)
-        h_list = c_line_content[1:]
-        # Remove blanks
-        while("" in h_list):
-          h_list.remove("")
-        # Convert the strings to numbers
-        for h_index in range(0, len(h_list)):
-          h_list[h_index] = float(h_list[h_index])
-        height_dictionary[h_name] = h_list
-
-      # Exit the loop if we see another data configuration
-      if (c_line_content[1] == "r" and line_count != 0) or \
-          (c_line_content[1] == "c" and line_count != 0):
-        # Break out of the with loop once a dataset is collected
-        raise fragile.Break
-
-      line_count += 1
-
-  line_buffer = line_count
-  return [line_buffer, config, height_dictionary, color_dictionary]
+  budget = options["line_budget"]
+  if not budget or len(height_list) <= budget:
+    points = []
+    x_index = 0
+    for r_size in height_list:
+      points.append([x_index, r_size])
+      x_index += config["rect_width"]
+    return points
+
+  indexes = downsample.DOWNSAMPLERS[options["downsample"]](height_list, budget)
+  return [[index * config["rect_width"], height_list[index]] for index in indexes]
+
+def too_dense_for_dots(points, options):
+  """
+    Checks if the given line points are packed tighter than the dot density
+    limit (in dots per unit along x), in which case the dots are left out
+  """
+  if not options["dot_density"] or len(points) < 2:
+    return False
+  width = points[-1][0] - points[0][0]
+  return width <= 0 or (len(points) - 1) / width > options["dot_density"]
 
 #######################################
 #######################################
@@ -142,75 +191,102 @@ def conf_graph(line_buffer):
 ###
 #######################################
 #######################################
-def draw_rect_graph(config, height_dictionary, color_dictionary):
+def draw_rect_graph(dataset, options=None):
   """
     Draws the rectangle graph with the given hight and color values
   """
+  if isinstance(dataset, UnreadGroup):
+    # The group couldn't be parsed, so its parse error is its render error
+    raise dataset.error
+
+  if isinstance(dataset, StreamedGroup):
+    # Too big to load, so it is drawn straight from the csv file
+    import stream_render
+    stream_render.draw_streamed_group(dataset, options)
+    return
+
+  config = dataset.config
   if config["draw_mode"] != "r":
     # toss the data to make a round graph
-    draw_round_graph(config, height_dictionary, color_dictionary)
+    draw_round_graph(dataset, options)
+    return
+
+  options = render_options(options)
+  if options["templates"] and chart_templates.can_template(options):
+    output = options["output"]
+    if output is None:
+      output = output_name(config, options)
+    chart_templates.draw_template_graph(dataset, output)
+    print("Exported file:", output_name(config, options))
     return
 
-  dwg = svgwrite.Drawing(config["filename"] + ".svg", profile="full")
+  writer = open_group_writer(config, options)
+  try:
+    draw_rect_shapes(writer, dataset, options)
+  except BaseException:
+    writer.discard()
+    raise
+
+  # write svg file to disk
+  writer.close()
+  print("Exported file:", output_name(config, options))
+
+def draw_rect_shapes(writer, dataset, options):
+  """
+    Draws the bars, lines and dots of the given rectangle graph
+  """
+  config = dataset.config
   v_offset_origin = config["v_offset"]
 
   if config["show_rect"] == "true":
     # For making the bar graphs
-    for group_index in range(1, len(height_dictionary)):
+    for group_index in range(1, len(dataset.series)):
+      height_list = dataset.series[group_index]
+      fill_color = dataset.colors[group_index]
+      if options["bar_width"] and len(height_list) - 1 > options["bar_width"]:
+        # More bars than pixels, so draw a bar per bin of values instead
+        with profile_stage(options, "geometry"):
+          bars = downsample.bin_bars(height_list[1:], options["bar_width"], options["bar_aggregate"])
+        for start, end, low, high in bars:
+          writer.rect((start * config["rect_width"], -high + v_offset_origin),
+            ((end - start) * config["rect_width"], high - low),
+            fill=fill_color)
+        v_offset_origin += config["v_offset"]
+        continue
       x_index = 0
-      for list_index in range(1, len(height_dictionary["height_list_"+str(group_index)])):
+      for list_index in range(1, len(height_list)):
         # draw the boxes
-        r_size = height_dictionary["height_list_"+str(group_index)][list_index]
-        dwg.add(dwg.rect((x_index, -r_size + v_offset_origin), (config["rect_width"], r_size),
-          fill=color_dictionary["color_"+str(group_index)])
-        )
+        r_size = height_list[list_index]
+        writer.rect((x_index, -r_size + v_offset_origin), (config["rect_width"], r_size),
+          fill=fill_color)
         x_index += config["rect_width"]
       v_offset_origin += config["v_offset"]
 
   if config["show_line"] == "true":
     # For connecting the dots together
-    config["v_offset"] = v_offset_origin
-    for group_index in range(0, len(height_dictionary)):
-      line_points = "M"
-      x_index = 0
-      l_max = len(height_dictionary["height_list_"+str(group_index)])
-      for list_index in range(0, l_max):
-        # draw the boxes
-        r_size = height_dictionary["height_list_"+str(group_index)][list_index]
-        if list_index < l_max-1:
-          line_points = line_points + str(x_index) + "," + str(-r_size + v_offset_origin) + ", "
-        else:
-          line_points = line_points + str(x_index) + "," + str(-r_size + v_offset_origin)
-        x_index += config["rect_width"]
+    line_v_offset = v_offset_origin
+    series_points = [] # the points of every line, which the dots are drawn on too
+    for height_list, line_color in zip(dataset.series, dataset.colors):
+      with profile_stage(options, "geometry"):
+        points = line_points_of(height_list, config, options)
+      series_points.append(points)
+      line_points = [(x_index, -r_size + v_offset_origin) for x_index, r_size in points]
 
       # draw a cubic-bezier-curve path
-      dwg.add(dwg.path( d=line_points,
-        stroke=color_dictionary["color_"+str(group_index)],
-        fill="none",
+      writer.polyline(line_points,
+        stroke=line_color,
         stroke_width=config["st_width"])
-      )
-      v_offset_origin += config["v_offset"]
+      v_offset_origin += line_v_offset
 
     # For making the dots at the corner of each rectangle
-    v_offset_origin = config["v_offset"]
-    for group_index in range(0, len(height_dictionary)):
-      x_index = 0
-      for list_index in range(0, len(height_dictionary["height_list_"+str(group_index)])):
-        # draw the boxes
-        r_size = height_dictionary["height_list_"+str(group_index)][list_index]
-        dwg.add(dwg.circle(center=(x_index, -r_size + v_offset_origin),
-          r=config["dot_radius"],
-          fill=color_dictionary["color_"+str(group_index)])
-        )
-        x_index += config["rect_width"]
-      v_offset_origin += config["v_offset"]
-
-  # output our svg image as raw xml
-  #print(dwg.tostring())
-
-  # write svg file to disk
-  dwg.save()
-  print("Exported file:", config["filename"] + ".svg")
+    v_offset_origin = line_v_offset
+    for points, dot_color in zip(series_points, dataset.colors):
+      if not too_dense_for_dots(points, options):
+        for x_index, r_size in points:
+          writer.circle(center=(x_index, -r_size + v_offset_origin),
+            r=config["dot_radius"],
+            fill=dot_color)
+      v_offset_origin += line_v_offset
 
 #######################################
 #######################################
@@ -219,19 +295,9 @@ def draw_rect_graph(config, height_dictionary, color_dictionary):
 ###
 #######################################
 #######################################
-def addArc(dwg, current_group, p0, p1, radius, f_color, line_stroke_width):
+def addArc(writer, p0, p1, radius, f_color, line_stroke_width):
     """ Adds an arc that bulges to the right as it moves from p0 to p1 """
-    args = {'x0':p0[0], 
-        'y0':p0[1], 
-        'xradius':radius, 
-        'yradius':radius, 
-        'ellipseRotation':0, #has no effect for circles
-        'x1':(p1[0]-p0[0]), 
-        'y1':(p1[1]-p0[1])}
-    current_group.add(dwg.path(d="M %(x0)f,%(y0)f a %(xradius)f,%(yradius)f %(ellipseRotation)f 0,0 %(x1)f,%(y1)f M0,0"%args,
-             fill='none', 
-             stroke=f_color, stroke_width=line_stroke_width
-            ))
+    writer.arc(p0, p1, radius, stroke=f_color, stroke_width=line_stroke_width)
 
 def anglept(angle=0):
   """Finds the location of a point on the circle. This assumes the center is at 0,0"""
@@ -245,43 +311,40 @@ def anglept(angle=0):
   point=[x_point + center_offset, y_point + center_offset]
   return point
 
-def num_to_degree(index=0, list_given=None):
-  """
-    Calculates the degrees of 360° from the total of the given list
-    Note: Degree is cumulative, and if the degree is over 180°, the function
-          will split the degree into two parts (180° + the remainder)
-          Eg: index=1 will have the degree of 360° of index=0 + index=1
-  """
-  if list_given == None:
-    print("num_to_percent wasn't given a list")
-    exit(1)
-  total = 0
-  divisor = 0
-  for num in range(0,len(list_given)):
-    total += list_given[num] # add all the list numbers
-    if num <= index:
-      divisor += list_given[num] # get the sum up to the index given
-
-  # Check if the current number is over 50%
-  isOverHalf = False
-  numerator = list_given[index]
-  if round((numerator / total)*100) > 50:
-    isOverHalf = True
-  return [isOverHalf, round((divisor / total)*360)]
-
-def draw_round_graph(config, height_dictionary, color_dictionary):
+def draw_round_graph(dataset, options=None):
   """
     Draws the donut or pie graph with the given hight and color values
   """
+  config = dataset.config
   if config["draw_mode"] != "c":
     # toss the data to make a round graph
-    draw_round_graph(config, height_dictionary, color_dictionary)
+    draw_round_graph(dataset, options)
     return
 
+  options = render_options(options)
+  writer = open_group_writer(config, options, size=(175,175))
+  try:
+    slice_table = draw_round_shapes(writer, dataset, options)
+  except BaseException:
+    writer.discard()
+    raise
+  writer.close()
+  print("Exported file:", output_name(config, options))
+  if slice_table is not None:
+    write_slice_table(slice_table, config, options)
+
+def draw_round_shapes(writer, dataset, options):
+  """
+    Draws the slices of the given donut or pie graph.
+    Returns the slice table when options["slice_table"] is set.
+  """
+  config = dataset.config
   line_stroke_w = config["line_stroke_width"]
   name="circle" # we need a name for the graph, tho it doesn't matter what it is
-  dwg = svgwrite.Drawing(filename=config["filename"] + ".svg", size=(175,175))
-  current_group = dwg.add(dwg.g(id=name, stroke='red', stroke_width=3, fill='red', fill_opacity=1 ))
+  if options["bundle"] is not None:
+    # Every graph of a bundle is in the same document, so the ids must differ
+    name = options["bundle"].chart_id() + "-" + name
+  writer.begin_group(id=name, stroke='red', stroke_width=3, fill='red', fill_opacity=1 )
 
 
   # This is kinda arbitrary, but we want a constant radius, so here it is.
@@ -292,31 +355,43 @@ def draw_round_graph(config, height_dictionary, color_dictionary):
   if config["make_donut"] != "true":
     line_stroke_w = circle_size*2
 
-  graph_numbers = dict_to_list(height_dictionary)
-  graph_colors = dict_to_list(color_dictionary)
+  # Each slice is the first number of its row
+  graph_numbers = [height_list[0] for height_list in dataset.series]
+  graph_colors = dataset.colors
+  labels = range(1, len(graph_numbers) + 1)
+  if options["min_slice"] or options["top_slices"] is not None:
+    # Keep the number of slices (and arcs) down by merging the small ones
+    graph_numbers, graph_colors, labels = coalesce_slices(graph_numbers, graph_colors,
+      options["min_slice"], options["top_slices"], options["other_color"])
+  slice_table = [] if options["slice_table"] else None
+
+  # Work out every slice at once instead of re-adding the list per slice
+  with profile_stage(options, "geometry"):
+    slices = slice_geometry(graph_numbers)
 
   last_angle_used = 0
   # Look thru all the numbers in the list and graph them out!
   for index in range(0, len(graph_numbers)):
     split = 1
+    isOverHalf, degree, percentage = slices[index]
 
     # Set the slice color  
     fill_color = graph_colors[index]
 
     # Check if we need to split the slice to 2 pieces (if slice is over 180°)
-    if num_to_degree(index, graph_numbers)[0]:
+    if isOverHalf:
       split = 2
 
     # Create the slice points
     if index == 0 and index != len(graph_numbers):
       # start the first slice at 0
       start_angle = last_angle_used
-      end_angle = num_to_degree(index, graph_numbers)[1] / split
+      end_angle = degree / split
       #print("a first slice", start_angle, end_angle)
     elif index != len(graph_numbers):
       # Start at the last slice calculated
       start_angle = last_angle_used
-      end_angle = num_to_degree(index, graph_numbers)[1] / split
+      end_angle = degree / split
       #print("a followed slice", start_angle, end_angle)
     else:
       start_angle = 0
@@ -327,44 +402,546 @@ def draw_round_graph(config, height_dictionary, color_dictionary):
     # then recalculate the points for the second half slice.
     if split == 2:
       # Draw the split slice
-      addArc(dwg, current_group, p0=anglept(end_angle), p1=anglept(start_angle), radius=circle_size, f_color=fill_color, line_stroke_width=line_stroke_w)
+      addArc(writer, p0=anglept(end_angle), p1=anglept(start_angle), radius=circle_size, f_color=fill_color, line_stroke_width=line_stroke_w)
       # Then update to the second half of the slice
       start_angle = end_angle
-      end_angle = num_to_degree(index, graph_numbers)[1]
+      end_angle = degree
 
     # Print the % of what the slice takes up.
-    percentage = round(num_to_degree(index, graph_numbers)[1]/3.6)
-    if index != 0:
-      percentage = percentage - round(num_to_degree(index-1, graph_numbers)[1]/3.6)
-    print(index+1, ':', percentage, '%')
+    if slice_table is None:
+      print(labels[index], ':', percentage, '%')
+    else:
+      slice_table.append([labels[index], fill_color, graph_numbers[index], percentage])
 
     # Draw the slice
-    addArc(dwg, current_group, p0=anglept(end_angle), p1=anglept(start_angle), radius=circle_size, f_color=fill_color, line_stroke_width=line_stroke_w)
+    addArc(writer, p0=anglept(end_angle), p1=anglept(start_angle), radius=circle_size, f_color=fill_color, line_stroke_width=line_stroke_w)
 
     last_angle_used = end_angle
 
-  dwg.save()
-  print("Exported file:", config["filename"] + ".svg")
+  writer.end_group()
+  return slice_table
 
+def slice_table_name(config, options=None):
+  """
+    Returns the name of the csv file the slice %s of the given group go to
+  """
+  file_name = config["filename"] + ".slices.csv"
+  if options and options.get("out_dir"):
+    return os.path.join(options["out_dir"], file_name)
+  return file_name
 
-################################################################################
-################################################################################
-print("Please input CSV file name (including the .cvs extention)")
-print("Default: sample_data.csv")
-csv_file = input("File name: ")
+def write_slice_table(slice_table, config, options=None):
+  """
+    Writes the given [slice, color, number, percentage] rows to the slice
+    table of the given group
+  """
+  with open(slice_table_name(config, options), "w", newline="") as table_output:
+    table = csv.writer(table_output)
+    table.writerow(["slice", "color", "number", "percentage"])
+    table.writerows(slice_table)
+
+
+#######################################
+#######################################
+### 
+### RENDERING
+###
+#######################################
+#######################################
+# Bump this whenever a change to the drawing code changes the output, so
+# the graphs in the render cache are drawn again
+RENDERER_VERSION = 1
+
+# Options that only change where the graphs go, not what they look like
+NON_RENDER_OPTIONS = ("out_dir", "profile", "output", "bundle", "templates",
+  "tile_points", "tile_aggregate", "stream_points")
+
+def render_options(options=None):
+  """
+    Returns the given options filled in with the defaults
+  """
+  return dict(DEFAULT_OPTIONS, **(options or {}))
 
-if not os.path.isfile(csv_file):
-  csv_file = "sample_data.csv"
+def output_name(config, options=None):
+  """
+    Returns the name of the file the given group is drawn to
+  """
+  file_name = config["filename"] + ".svg"
+  if options and options.get("svgz"):
+    file_name += "z"
+  if options and options.get("out_dir"):
+    return os.path.join(options["out_dir"], file_name)
+  return file_name
+
+def companion_outputs(config, options=None):
+  """
+    Returns the files besides the graph that drawing the given group writes
+    (the slice table of a pie/donut), which are cached along with the graph
+  """
+  if options and options.get("slice_table") and config["draw_mode"] == "c":
+    return [slice_table_name(config, options)]
+  return []
 
-print("===")
+def cache_key(cache, dataset, options):
+  """
+    Returns the render cache key of the given group
+  """
+  options = render_options(options)
+  for option in NON_RENDER_OPTIONS:
+    options.pop(option, None)
+  return cache.key(RENDERER_VERSION, dataset.to_json(), options)
 
+def render_job(job):
+  """
+    Renders one group inside a worker process.
+    Returns the group name, what the drawing printed, the error (if any) and
+    the group profile (if any), so the parent process can report the groups
+    in input order.
+  """
+  dataset, options = job
+  group_profile = options.get("profile")
+  printed = io.StringIO()
+  try:
+    with contextlib.redirect_stdout(printed), measure_group(group_profile):
+      draw_rect_graph(dataset, options)
+  except Exception as error:
+    return [dataset.config["filename"], printed.getvalue(), "%s: %s" % (type(error).__name__, error), group_profile]
+  return [dataset.config["filename"], printed.getvalue(), None, group_profile]
+
+def measure_group(group_profile):
+  """
+    Measures the render of a group, when it is profiled
+  """
+  if group_profile is None:
+    return contextlib.nullcontext()
+  return group_profile.measure()
 
-line_buffer = 0
-capture = conf_graph(line_buffer)
-line_buffer += capture[0]
-draw_rect_graph(capture[1], capture[2], capture[3])
-for i in range(0, header_count(csv_file)):
-  capture = conf_graph(line_buffer)
-  line_buffer += capture[0]
-  draw_rect_graph(capture[1], capture[2], capture[3])
+def report_job(name, future):
+  """
+    Waits for the given job, then prints its output or its error.
+    Returns the error (None if the group was rendered) and the group profile.
+  """
+  try:
+    name, printed, error, group_profile = future.result()
+  except Exception as pool_error: # eg: the worker process died
+    printed, error, group_profile = "", "%s: %s" % (type(pool_error).__name__, pool_error), None
+  print(printed, end="")
+  if error is not None:
+    print("Failed to render", name + ":", error, file=sys.stderr)
+  return error, group_profile
+
+def render_groups(groups, options=None, jobs=1, cache=None, profile=None):
+  """
+    Renders the given groups, with a pool of worker processes if jobs > 1.
+    With a render cache, the groups that haven't changed are not drawn again.
+    With a profiling.RunProfile, every group is timed and counted.
+    A group that fails only reports an error instead of stopping the batch.
+    Returns a [group name, output file, error] list for each group, in order.
+  """
+  options = dict(options or {})
+  results = []
+  if profile is not None:
+    groups = profile.timed_groups(groups)
+  else:
+    groups = ((dataset, None) for dataset in groups)
+
+  if jobs <= 1:
+    for dataset, group_profile in groups:
+      config = dataset.config
+      group_options = options
+      if group_profile is not None:
+        group_options = dict(options, profile=group_profile)
+        profile.add(group_profile)
+      key = None
+      if cache is not None:
+        key = cache_key(cache, dataset, options)
+        if cache.restore(key, output_name(config, options), companion_outputs(config, options)):
+          print("Unchanged file:", output_name(config, options))
+          results.append([config["filename"], output_name(config, options), None])
+          continue
+      try:
+        with measure_group(group_profile):
+          draw_rect_graph(dataset, group_options)
+      except Exception as error:
+        error = "%s: %s" % (type(error).__name__, error)
+        print("Failed to render", config["filename"] + ":", error, file=sys.stderr)
+        results.append([config["filename"], output_name(config, options), error])
+        continue
+      if key is not None:
+        cache.store(key, output_name(config, options), companion_outputs(config, options))
+      results.append([config["filename"], output_name(config, options), None])
+    return results
+
+  import collections
+  import concurrent.futures
+  pending = collections.deque()
+
+  def report_oldest():
+    config, key, future = pending.popleft()
+    error, group_profile = report_job(config["filename"], future)
+    if error is None and key is not None:
+      cache.store(key, output_name(config, options), companion_outputs(config, options))
+    if group_profile is not None:
+      profile.add(group_profile)
+    results.append([config["filename"], output_name(config, options), error])
+
+  with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+    try:
+      for dataset, group_profile in groups:
+        config = dataset.config
+        group_options = options
+        if group_profile is not None:
+          group_options = dict(options, profile=group_profile)
+        key = None
+        if cache is not None:
+          key = cache_key(cache, dataset, options)
+          if cache.restore(key, output_name(config, options), companion_outputs(config, options)):
+            # Report it in turn with the groups that are still being drawn
+            future = concurrent.futures.Future()
+            future.set_result([config["filename"], "Unchanged file: " + output_name(config, options) + "\n", None, group_profile])
+            pending.append((config, None, future))
+            continue
+        future = pool.submit(render_job, (dataset, group_options))
+        pending.append((config, key, future))
+        # Only keep a couple of groups queued per worker, so the whole file
+        # doesn't have to be parsed before the first chart is reported
+        if len(pending) >= jobs * 2:
+          report_oldest()
+    finally:
+      # Report what was drawn, even when reading the groups failed
+      while pending:
+        report_oldest()
+  return results
 
+#######################################
+#######################################
+### 
+### LIBRARY
+###
+#######################################
+#######################################
+def csv_groups(csv_file, only=None, keep_parsed=False, stream_points=None):
+  """
+    Yields the groups of the given csv file to render: every group, or
+    just the ones with the given file name.
+    With keep_parsed, the parsed groups are kept in a binary sidecar file
+    (see data_cache.py) that is read instead of the csv file next time.
+    With stream_points, the rectangle graphs with more points than that are
+    left in the csv file and drawn row by row (see stream_render.py).
+    A csv_file of "-" reads the groups from stdin.
+  """
+  if csv_file == "-":
+    # stdin can only be read once, so there's no index or sidecar to use
+    csv_input = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    found = False
+    for dataset in stream_groups(csv_input):
+      if only is None or dataset.config["filename"] == only:
+        found = True
+        yield dataset
+    if only is not None and not found:
+      raise LookupError("No group named " + only + " in stdin")
+    return
+
+  if stream_points:
+    import stream_render
+    entries = group_index.load_group_index(csv_file)
+    if only is not None:
+      entries = [entry for entry in entries if entry["name"] == only]
+      if not entries:
+        raise LookupError("No group named " + only + " in " + csv_file)
+    yield from stream_render.streamed_groups(csv_file, entries, stream_points)
+    return
+
+  if keep_parsed:
+    import data_cache
+    if only is None:
+      yield from data_cache.read_cached_groups(csv_file, read_groups)
+      return
+    datasets = data_cache.load_groups(csv_file)
+    if datasets is not None:
+      datasets = [dataset for dataset in datasets if dataset.config["filename"] == only]
+      if not datasets:
+        raise LookupError("No group named " + only + " in " + csv_file)
+      yield from datasets
+      return
+
+  if only is None:
+    yield from read_groups(csv_file)
+    return
+
+  # Seek straight to the wanted group(s) using the sidecar index
+  entries = group_index.find_groups(csv_file, only)
+  if not entries:
+    raise LookupError("No group named " + only + " in " + csv_file)
+  for entry in entries:
+    yield from parse_groups(group_index.read_group_lines(csv_file, entry))
+
+def render_group(dataset, out_dir=None, options=None):
+  """
+    Draws a single group (a Dataset) and returns the name of the file it was
+    drawn to
+  """
+  options = dict(options or {})
+  if out_dir is not None:
+    options["out_dir"] = out_dir
+    os.makedirs(out_dir, exist_ok=True)
+  draw_rect_graph(dataset, options)
+  return output_name(dataset.config, options)
+
+def csv_render_groups(csv_file, out_dir=None, options=None, only=None, keep_parsed=False):
+  """
+    Returns the options (with out_dir) and the groups to draw for the given
+    csv file, split into tiles when the options ask for it
+  """
+  options = dict(options or {})
+  if out_dir is not None:
+    options["out_dir"] = out_dir
+    os.makedirs(out_dir, exist_ok=True)
+  groups = csv_groups(csv_file, only, keep_parsed, options.get("stream_points"))
+  if options.get("tile_points"):
+    import tiles
+    groups = tiles.tiled_groups(groups, options["tile_points"], out_dir,
+      options.get("tile_aggregate", "max"))
+  return options, groups
+
+def render_csv(csv_file, out_dir=None, options=None, jobs=1, cache=None, only=None, profile=None,
+    keep_parsed=False):
+  """
+    Draws every group of the given csv file (or just the `only` ones).
+    keep_parsed saves the parsed groups for the next run (see csv_groups()).
+    Returns a [group name, output file, error] list for each group.
+  """
+  options, groups = csv_render_groups(csv_file, out_dir, options, only, keep_parsed)
+  return render_groups(groups, options, jobs, cache, profile)
+
+################################################################################
+################################################################################
+def positive_int(text):
+  """
+    Reads a command line count that has to be at least 1
+  """
+  import argparse
+  value = int(text)
+  if value < 1:
+    raise argparse.ArgumentTypeError("has to be 1 or more, not " + text)
+  return value
+
+def main(argv=None):
+  """
+    Command line interface
+  """
+  import argparse
+  parser = argparse.ArgumentParser(description="Draws SVG graphs from a CSV file")
+  parser.add_argument("csv_file", nargs="?",
+    help="CSV file to read (- for stdin), asked for when not given")
+  parser.add_argument("--out-dir", metavar="DIR",
+    help="directory to write the graphs to, instead of the current one")
+  parser.add_argument("--only", metavar="NAME",
+    help="only render the group(s) with the given file name")
+  parser.add_argument("--writer", choices=sorted(svg_writer.WRITERS), default="svgwrite",
+    help="svgwrite validates every value, stream writes straight to the file, "
+      "compact streams a smaller file (shared dots, merged bars, rounded coordinates)")
+  parser.add_argument("--templates", action="store_true",
+    help="draw the rectangle graphs that share a shape (config and series lengths) "
+      "from a template compiled once per shape (stream/svgwrite output only)")
+  parser.add_argument("--precision", metavar="N", type=int, default=svg_writer.DEFAULT_PRECISION,
+    help="decimals kept in the coordinates of the compact writer")
+  parser.add_argument("--svgz", action="store_true",
+    help="gzip the graphs into .svgz files")
+  parser.add_argument("--line-budget", metavar="N", type=positive_int,
+    help="downsample every line to at most N points")
+  parser.add_argument("--downsample", choices=sorted(downsample.DOWNSAMPLERS), default="lttb",
+    help="lttb keeps the shape of the line, minmax keeps the lowest/highest points")
+  parser.add_argument("--dot-density", metavar="D", type=float,
+    help="leave out the dots of lines with over D points per unit of width")
+  parser.add_argument("--bar-width", metavar="PX", type=positive_int,
+    help="bin the bars of every series into at most PX bars, one per pixel of output width")
+  parser.add_argument("--bar-aggregate", choices=downsample.BAR_AGGREGATES, default="max",
+    help="height of a binned bar: the highest value, the mean, or a bar from the lowest "
+      "to the highest value (range)")
+  parser.add_argument("--tiles", metavar="N", type=positive_int,
+    help="split the graphs with over N points per series into a pyramid of tiles of N points, "
+      "in a NAME.tiles directory with an index.json of their x ranges")
+  parser.add_argument("--tile-aggregate", choices=["max", "mean"], default="max",
+    help="value of a binned point in the zoomed out tile levels")
+  parser.add_argument("--stream-points", metavar="N", type=positive_int,
+    help="draw the rectangle graphs with over N points row by row straight from the csv file, "
+      "so memory doesn't grow with the size of the group")
+  parser.add_argument("--min-slice", metavar="PCT", type=float,
+    help="merge the pie/donut slices under PCT %% of the total into an \"other\" slice")
+  parser.add_argument("--top-slices", metavar="K", type=int,
+    help="only draw the K biggest pie/donut slices, and merge the rest into an \"other\" slice")
+  parser.add_argument("--other-color", metavar="COLOR", default="gray",
+    help="color of the \"other\" slice")
+  parser.add_argument("--slice-table", action="store_true",
+    help="write the slice percentages to NAME.slices.csv instead of printing them")
+  parser.add_argument("--jobs", "-j", metavar="N", type=int, default=1,
+    help="render the groups with N worker processes")
+  parser.add_argument("--overlap", action="store_true",
+    help="read, draw and write the graphs at the same time, through bounded queues, "
+      "saving each graph to a temporary file that is renamed into place")
+  parser.add_argument("--writers", metavar="N", type=positive_int, default=4,
+    help="number of threads writing the graphs with --overlap")
+  parser.add_argument("--queue-size", metavar="N", type=positive_int, default=4,
+    help="most groups waiting between two --overlap stages")
+  parser.add_argument("--overlap-stats", metavar="FILE",
+    help="write the --overlap stage times and queue depths/waits to FILE as JSON")
+  parser.add_argument("--pipe", metavar="FORMAT", choices=["tar", "length"],
+    help="write the graphs to stdout as they are drawn, as a tar stream or as "
+      "length prefixed documents (see pipeline.py), instead of to files")
+  parser.add_argument("--bundle", metavar="FILE",
+    help="draw every graph into the single SVG file FILE, as a <symbol> each, "
+      "with a FILE.json manifest of the symbol ids and byte ranges")
+  parser.add_argument("--watch", action="store_true",
+    help="keep running and draw the groups that changed every time the csv file is saved, "
+      "deleting the graphs of removed groups")
+  parser.add_argument("--poll", metavar="SECONDS", type=float, default=0.5,
+    help="how often --watch checks the csv file")
+  parser.add_argument("--debounce", metavar="SECONDS", type=float, default=0.3,
+    help="how long the csv file has to stay the same before --watch draws it")
+  parser.add_argument("--cache", metavar="DIR",
+    help="keep the rendered graphs in DIR and skip the groups that haven't changed")
+  parser.add_argument("--cache-size", metavar="MB", type=float, default=256,
+    help="size limit of the render cache, the least recently used graphs are removed first")
+  parser.add_argument("--force", action="store_true",
+    help="draw every group again, even if the render cache has it")
+  parser.add_argument("--keep-parsed", action="store_true",
+    help="keep the parsed groups in a binary file next to the csv file, "
+      "so the next run with the same csv file skips the parsing")
+  parser.add_argument("--profile", metavar="FILE",
+    help="write the time spent reading, in geometry, drawing and saving each group, "
+      "with its element count and bytes written, to FILE as JSON")
+  parser.add_argument("--tracemalloc", action="store_true",
+    help="add the peak memory of each group to the --profile report")
+  parser.add_argument("--cprofile", metavar="FILE",
+    help="run under cProfile and save the stats to FILE (the parent process only)")
+  args = parser.parse_args(argv)
+  if args.pipe is not None and (args.jobs > 1 or args.cache is not None):
+    parser.error("--pipe draws one group at a time, without --jobs or --cache")
+  if args.watch and (args.pipe is not None or args.csv_file == "-"):
+    parser.error("--watch needs a csv file to watch")
+  if args.bundle is not None and (args.jobs > 1 or args.cache is not None
+      or args.pipe is not None or args.watch):
+    parser.error("--bundle draws one group at a time, without --jobs, --cache, --pipe or --watch")
+  if args.tiles is not None and (args.bundle is not None or args.pipe is not None or args.watch):
+    parser.error("--tiles writes a directory of tiles, without --bundle, --pipe or --watch")
+  if args.overlap and (args.jobs > 1 or args.pipe is not None or args.bundle is not None
+      or args.watch):
+    parser.error("--overlap draws in a single process, without --jobs, --pipe, --bundle or --watch")
+  if args.stream_points is not None and (args.csv_file == "-" or args.tiles is not None
+      or args.bundle is not None or args.pipe is not None or args.watch or args.keep_parsed):
+    parser.error("--stream-points reads the groups through the index of a csv file, "
+      "without stdin, --tiles, --bundle, --pipe, --watch or --keep-parsed")
+
+  if args.csv_file is not None and args.csv_file != "-" and not os.path.isfile(args.csv_file):
+    parser.error("no csv file named " + args.csv_file)
+
+  csv_file = args.csv_file
+  if csv_file is None and args.pipe is not None:
+    csv_file = "-" # stdin is the csv data, so don't ask for a file name
+  if csv_file is None:
+    print("Please input CSV file name (including the .cvs extention)")
+    print("Default: sample_data.csv")
+    csv_file = input("File name: ")
+    if not os.path.isfile(csv_file):
+      csv_file = "sample_data.csv"
+
+  if args.pipe is None:
+    return render_cli(args, csv_file)
+  # stdout only carries the graphs, so everything else is printed to stderr
+  pipe_output = sys.stdout.buffer
+  with contextlib.redirect_stdout(sys.stderr):
+    return render_cli(args, csv_file, pipe_output)
+
+def render_cli(args, csv_file, pipe_output=None):
+  """
+    Renders the csv file with the parsed command line options, to files or
+    (with --pipe) to the given binary stream
+  """
+  print("===")
+
+  options = {
+    "writer" : args.writer,
+    "line_budget" : args.line_budget,
+    "downsample" : args.downsample,
+    "dot_density" : args.dot_density,
+    "bar_width" : args.bar_width,
+    "bar_aggregate" : args.bar_aggregate,
+    "min_slice" : args.min_slice,
+    "top_slices" : args.top_slices,
+    "other_color" : args.other_color,
+    "slice_table" : args.slice_table,
+    "templates" : args.templates,
+    "tile_points" : args.tiles,
+    "tile_aggregate" : args.tile_aggregate,
+    "stream_points" : args.stream_points,
+    "precision" : args.precision,
+    "svgz" : args.svgz,
+  }
+
+  cache = None
+  if args.cache is not None:
+    import render_cache
+    cache = render_cache.RenderCache(args.cache, int(args.cache_size * 1024 * 1024), args.force)
+
+  profile = None
+  if args.profile is not None or args.tracemalloc:
+    import profiling
+    profile = profiling.RunProfile(args.tracemalloc)
+
+  if args.watch:
+    import watch
+    try:
+      watch.watch_csv(csv_file, args.out_dir, options, args.jobs, args.only, args.poll, args.debounce)
+    except KeyboardInterrupt:
+      pass
+    return 0
+
+  c_profile = None
+  if args.cprofile is not None:
+    import cProfile
+    c_profile = cProfile.Profile()
+    c_profile.enable()
+  try:
+    if args.bundle is not None:
+      import bundle
+      results = bundle.bundle_groups(csv_groups(csv_file, args.only, args.keep_parsed),
+        args.bundle, options)
+      print("Bundled file:", args.bundle)
+    elif pipe_output is not None:
+      import pipeline
+      results = pipeline.pipe_groups(csv_groups(csv_file, args.only, args.keep_parsed),
+        pipe_output, args.pipe, options)
+    elif args.overlap:
+      import overlap
+      results, overlap_stats = overlap.overlap_csv(csv_file, args.out_dir, options, args.writers,
+        args.queue_size, cache, args.only, profile, args.keep_parsed)
+      overlap_stats.print_summary()
+      if args.overlap_stats is not None:
+        overlap_stats.dump(args.overlap_stats)
+        print("Overlap stats:", args.overlap_stats)
+    else:
+      results = render_csv(csv_file, args.out_dir, options, args.jobs, cache, args.only, profile,
+        args.keep_parsed)
+  except LookupError as error:
+    print(error)
+    return 1
+  finally:
+    if c_profile is not None:
+      c_profile.disable()
+      c_profile.dump_stats(args.cprofile)
+      import pstats
+      pstats.Stats(c_profile, stream=sys.stderr).sort_stats("cumulative").print_stats(15)
+
+  if profile is not None and args.profile is not None:
+    profile.dump(args.profile)
+    print("Profile:", args.profile)
+  if cache is not None:
+    print("Render cache:", cache.hits, "hits,", cache.misses, "misses")
+  for name, output, error in results:
+    if error is not None:
+      return 1
+  return 0
+
+if __name__ == "__main__":
+  exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# group_index.py
+# Last Updated:
+# Purpose: Records where every group of a CSV file starts, so a single group
+#          can be read back without going through the whole file.
+# Notes:
+#       - The index is saved next to the CSV file as "<csv file>.idx"
+#       - The index is rebuilt whenever the CSV file size or mtime changes
+#
+import csv      # for the quoted rows
+import io       # for reading a group back as text
+import json     # for the sidecar file
+import os       # for file checking
+
+INDEX_VERSION = 2
+INDEX_SUFFIX = ".idx"
+
+def split_row(csv_line):
+  """
+    Splits the given csv line (in bytes) into its fields, the same way the
+    csv module reads them when a field is quoted
+  """
+  csv_line = csv_line.rstrip(b"\r\n")
+  if b'"' not in csv_line:
+    return csv_line.split(b",")
+  row = next(csv.reader([csv_line.decode("utf-8")]), [])
+  return [field.encode("utf-8") for field in row]
+
+def is_header(fields):
+  """
+    Checks if the given split csv row is the start of a group
+  """
+  return len(fields) > 1 and (fields[1] == b"r" or fields[1] == b"c")
+
+def build_group_index(file_name):
+  """
+    Scans the given csv file once and returns the byte offset and length of
+    every group, along with the number of data rows below each header and
+    the number of values (points) in them.
+  """
+  groups = []
+  with open(file_name, "rb") as csv_input:
+    offset = len(csv_input.readline()) # skip the first line
+    for csv_line in csv_input:
+      fields = split_row(csv_line)
+      if is_header(fields):
+        # Close off the previous group right before this header
+        if groups:
+          groups[-1]["length"] = offset - groups[-1]["offset"]
+        groups.append({
+          "name" : fields[0].decode("utf-8"),
+          "offset" : offset,
+          "length" : 0,
+          "rows" : 0,
+          "points" : 0,
+        })
+      elif groups and len(fields) > 1:
+        groups[-1]["rows"] += 1
+        # Every non empty field but the color is a value
+        groups[-1]["points"] += len(fields) - fields.count(b"") - (1 if fields[0] else 0)
+      offset += len(csv_line)
+
+  if groups:
+    groups[-1]["length"] = offset - groups[-1]["offset"]
+  return groups
+
+def index_file_name(file_name):
+  """
+    Returns the name of the sidecar index for the given csv file
+  """
+  return file_name + INDEX_SUFFIX
+
+def load_group_index(file_name):
+  """
+    Returns the group index of the given csv file.
+    The sidecar index is reused while the csv file size and mtime match,
+    otherwise the index is rebuilt and saved again.
+  """
+  stat = os.stat(file_name)
+  sidecar = index_file_name(file_name)
+  try:
+    with open(sidecar, "r") as index_input:
+      index = json.load(index_input)
+    if index["version"] == INDEX_VERSION and index["size"] == stat.st_size \
+        and index["mtime_ns"] == stat.st_mtime_ns:
+      return index["groups"]
+  except (OSError, ValueError, KeyError):
+    pass # missing or broken index, so just build it again
+
+  groups = build_group_index(file_name)
+  index = {
+    "version" : INDEX_VERSION,
+    "size" : stat.st_size,
+    "mtime_ns" : stat.st_mtime_ns,
+    "groups" : groups,
+  }
+  try:
+    with open(sidecar, "w") as index_output:
+      json.dump(index, index_output)
+  except OSError:
+    pass # the index is only a speedup, so a read-only directory is fine
+  return groups
+
+def find_groups(file_name, name):
+  """
+    Returns the index entries of every group with the given file name
+  """
+  return [entry for entry in load_group_index(file_name) if entry["name"] == name]
+
+def read_group_lines(file_name, entry):
+  """
+    Seeks straight to the given group and returns its lines as text
+  """
+  with open(file_name, "rb") as csv_input:
+    csv_input.seek(entry["offset"])
+    data = csv_input.read(entry["length"])
+  return io.TextIOWrapper(io.BytesIO(data), encoding="utf-8", newline="")
+
+def iter_group_lines(file_name, entry):
+  """
+    Seeks straight to the given group and yields its lines as text one at a
+    time, so the group never has to fit in memory
+  """
+  with open(file_name, "rb") as csv_input:
+    csv_input.seek(entry["offset"])
+    remaining = entry["length"]
+    while remaining > 0:
+      csv_line = csv_input.readline(remaining)
+      if not csv_line:
+        break
+      remaining -= len(csv_line)
+      yield csv_line.decode("utf-8")
+
+def group_digest(file_name, entry, chunk_size=1 << 20):
+  """
+    Returns the sha256 hex digest of the bytes of the given group, read a
+    chunk at a time
+  """
+  import hashlib
+  digest = hashlib.sha256()
+  with open(file_name, "rb") as csv_input:
+    csv_input.seek(entry["offset"])
+    remaining = entry["length"]
+    while remaining > 0:
+      chunk = csv_input.read(min(chunk_size, remaining))
+      if not chunk:
+        break
+      remaining -= len(chunk)
+      digest.update(chunk)
+  return digest.hexdigest()
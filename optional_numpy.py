@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# optional_numpy.py
+# Last Updated:
+# Purpose: Imports NumPy lazily for the modules that can use it to speed up
+#          big inputs, and still work without it.
+#
+numpy = None # imported on first use, False if it isn't installed
+
+def load_numpy():
+  """
+    Imports NumPy the first time it is needed, so startup stays fast.
+    Returns the numpy module, or False if it isn't installed.
+  """
+  global numpy
+  if numpy is None:
+    try:
+      import numpy
+    except ImportError:
+      numpy = False
+  return numpy
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# overlap.py
+# Last Updated:
+# Purpose: Renders a CSV file with reading, drawing and writing overlapped,
+#          instead of waiting for each graph to be saved before the next
+#          group is read:
+#          - read: a thread parses the groups into the render queue
+#          - render: the main thread draws each group in memory into the
+#                    write queue
+#          - write: a few threads save the graphs, each one to a temporary
+#                   file that is renamed over the graph file once complete
+#          Both queues are bounded, so a slow stage holds back the stages in
+#          front of it instead of piling up graphs in memory. How full each
+#          queue got and how long each side waited on it are reported, to
+#          tune the number of writers and the queue size.
+# Notes:
+#       - Groups are still reported in the order of the CSV file
+#       - A group that can't be parsed reaches the render stage as an
+#         UnreadGroup, which fails there on its own, so only an error
+#         reading the file itself stops the read stage
+#       - A graph file is never seen half written, since it only appears
+#         once it is renamed into place
+#
+import collections # for the groups waiting to be reported
+import concurrent.futures # for the write results
+import contextlib # for catching what the drawing prints
+import io       # for drawing in memory
+import json     # for the stats file
+import os       # for the atomic renames
+import queue    # for the stage queues
+import sys      # for reporting errors
+import threading # for the read and write stages
+import time     # for the stage timings
+
+import graphs
+import svg_writer
+
+DEFAULT_WRITERS = 4
+DEFAULT_QUEUE_SIZE = 4
+
+# Put at the end of a queue, once there is nothing left to take
+END = None
+
+class StageQueue(object):
+  """
+    Bounded queue between two stages, which keeps track of how full it gets
+    and how long each side waited on it
+  """
+  def __init__(self, name, size):
+    self.name = name
+    self.size = size
+    self.queue = queue.Queue(maxsize=size)
+    self.lock = threading.Lock()
+    self.items = 0
+    self.max_depth = 0
+    self.total_depth = 0
+    self.put_wait = 0.0 # producers stalled on a full queue
+    self.get_wait = 0.0 # consumers starved by an empty queue
+
+  def put(self, item):
+    start = time.perf_counter()
+    self.queue.put(item)
+    waited = time.perf_counter() - start
+    with self.lock:
+      self.put_wait += waited
+      if item is not END:
+        depth = self.queue.qsize()
+        self.items += 1
+        self.total_depth += depth
+        self.max_depth = max(self.max_depth, depth)
+
+  def get(self):
+    start = time.perf_counter()
+    item = self.queue.get()
+    waited = time.perf_counter() - start
+    with self.lock:
+      self.get_wait += waited
+    return item
+
+  def to_json(self):
+    with self.lock:
+      return {
+        "size" : self.size,
+        "items" : self.items,
+        "max_depth" : self.max_depth,
+        "mean_depth" : self.total_depth / self.items if self.items else 0.0,
+        "put_wait_seconds" : self.put_wait,
+        "get_wait_seconds" : self.get_wait,
+      }
+
+class OverlapStats(object):
+  """
+    Busy time of every stage and the state of the queues between them
+  """
+  def __init__(self, writers, queue_size):
+    self.writers = writers
+    self.queue_size = queue_size
+    self.started = time.perf_counter()
+    self.wall_seconds = None
+    self.stages = {"read" : 0.0, "render" : 0.0, "write" : 0.0}
+    self.queues = []
+    self.lock = threading.Lock()
+
+  def add(self, stage_name, seconds):
+    with self.lock:
+      self.stages[stage_name] += seconds
+
+  def finish(self):
+    self.wall_seconds = time.perf_counter() - self.started
+
+  def to_json(self):
+    with self.lock:
+      return {
+        "writers" : self.writers,
+        "queue_size" : self.queue_size,
+        "wall_seconds" : self.wall_seconds,
+        "stage_seconds" : dict(self.stages), # the write stage is added up over its threads
+        "queues" : {stage_queue.name : stage_queue.to_json() for stage_queue in self.queues},
+      }
+
+  def dump(self, file_name):
+    with open(file_name, "w") as stats_output:
+      json.dump(self.to_json(), stats_output, indent=2)
+      stats_output.write("\n")
+
+  def print_summary(self):
+    stats = self.to_json()
+    print("Stages: read %.2fs, render %.2fs, write %.2fs (%d writers), %.2fs in all" % (
+      stats["stage_seconds"]["read"], stats["stage_seconds"]["render"],
+      stats["stage_seconds"]["write"], self.writers, stats["wall_seconds"] or 0.0))
+    for name, stage_queue in stats["queues"].items():
+      print("Queue %s: max depth %d/%d, mean %.1f, full for %.2fs, empty for %.2fs" % (name,
+        stage_queue["max_depth"], stage_queue["size"], stage_queue["mean_depth"],
+        stage_queue["put_wait_seconds"], stage_queue["get_wait_seconds"]))
+
+class ReadError(object):
+  """
+    Hands an error of the read stage over to the render stage
+  """
+  def __init__(self, error):
+    self.error = error
+
+def read_stage(groups, render_queue, stats):
+  """
+    Read thread: parses the groups into the render queue
+  """
+  iterator = iter(groups)
+  try:
+    while True:
+      start = time.perf_counter()
+      try:
+        item = next(iterator)
+      except StopIteration:
+        break
+      finally:
+        stats.add("read", time.perf_counter() - start)
+      render_queue.put(item)
+  except BaseException as error:
+    render_queue.put(ReadError(error))
+  render_queue.put(END)
+
+def write_file(file_name, data):
+  """
+    Writes the given bytes to a temporary file next to the given file, then
+    renames it over the file
+  """
+  directory, base_name = os.path.split(file_name)
+  temp_name = os.path.join(directory, ".%s.%d.%d.tmp" % (base_name, os.getpid(), threading.get_ident()))
+  try:
+    with open(temp_name, "wb") as graph_output:
+      graph_output.write(data)
+    os.replace(temp_name, file_name)
+  except BaseException:
+    if os.path.exists(temp_name):
+      os.remove(temp_name)
+    raise
+
+def write_stage(write_queue, stats):
+  """
+    Write thread: saves the drawn graphs until the end of the write queue
+  """
+  while True:
+    item = write_queue.get()
+    if item is END:
+      return
+    file_name, data, future = item
+    start = time.perf_counter()
+    try:
+      write_file(file_name, data)
+    except Exception as error:
+      future.set_result("%s: %s" % (type(error).__name__, error))
+    else:
+      future.set_result(None)
+    stats.add("write", time.perf_counter() - start)
+
+def draw_in_memory(dataset, options, group_profile=None):
+  """
+    Draws the given group in memory.
+    Returns what the drawing printed and the graph file contents.
+  """
+  svg = io.StringIO()
+  printed = io.StringIO()
+  with contextlib.redirect_stdout(printed), graphs.measure_group(group_profile):
+    graphs.draw_rect_graph(dataset, dict(options, output=svg, profile=group_profile))
+  data = svg.getvalue().encode("utf-8")
+  if options.get("svgz"):
+    data = svg_writer.gzip_bytes(data)
+  if group_profile is not None:
+    group_profile.bytes_written += len(data)
+  return printed.getvalue(), data
+
+def overlap_groups(groups, options=None, writers=DEFAULT_WRITERS, queue_size=DEFAULT_QUEUE_SIZE,
+    cache=None, profile=None):
+  """
+    Renders the given groups with the read, render and write stages
+    overlapped. A group that fails, to be read (see graphs.parse_groups())
+    or drawn or saved, is reported on its own and the other groups go on.
+    Returns a [group name, output file, error] list for each group, in
+    order, and the OverlapStats of the run.
+  """
+  options = dict(options or {})
+  stats = OverlapStats(writers, queue_size)
+  render_queue = StageQueue("render", queue_size)
+  write_queue = StageQueue("write", queue_size)
+  stats.queues = [render_queue, write_queue]
+  if profile is not None:
+    groups = profile.timed_groups(groups)
+  else:
+    groups = ((dataset, None) for dataset in groups)
+
+  results = []
+  # [config, cache key, what the drawing printed, stage, future] in csv order
+  pending = collections.deque()
+
+  def report_oldest():
+    config, key, printed, stage_name, future = pending.popleft()
+    error = future.result()
+    print(printed, end="")
+    if error is not None:
+      print("Failed to", stage_name, config["filename"] + ":", error, file=sys.stderr)
+    elif key is not None:
+      cache.store(key, graphs.output_name(config, options),
+        graphs.companion_outputs(config, options))
+    results.append([config["filename"], graphs.output_name(config, options), error])
+
+  reader = threading.Thread(target=read_stage, args=(groups, render_queue, stats), daemon=True)
+  write_threads = [threading.Thread(target=write_stage, args=(write_queue, stats), daemon=True)
+    for writer in range(0, writers)]
+  reader.start()
+  for write_thread in write_threads:
+    write_thread.start()
+
+  read_error = None
+  try:
+    while True:
+      item = render_queue.get()
+      if item is END:
+        break
+      if isinstance(item, ReadError):
+        read_error = item.error
+        continue
+      dataset, group_profile = item
+      config = dataset.config
+      if group_profile is not None:
+        profile.add(group_profile)
+      future = concurrent.futures.Future()
+
+      key = None
+      if cache is not None:
+        key = graphs.cache_key(cache, dataset, options)
+        if cache.restore(key, graphs.output_name(config, options),
+            graphs.companion_outputs(config, options)):
+          future.set_result(None)
+          pending.append([config, None, "Unchanged file: " + graphs.output_name(config, options) + "\n",
+            "restore", future])
+          continue
+
+      start = time.perf_counter()
+      try:
+        printed, data = draw_in_memory(dataset, options, group_profile)
+      except Exception as error:
+        stats.add("render", time.perf_counter() - start)
+        future.set_result("%s: %s" % (type(error).__name__, error))
+        pending.append([config, None, "", "render", future])
+      else:
+        stats.add("render", time.perf_counter() - start)
+        write_queue.put([graphs.output_name(config, options), data, future])
+        pending.append([config, key, printed, "write", future])
+
+      # Report the groups that are saved, without waiting on the rest
+      while pending and pending[0][4].done():
+        report_oldest()
+  finally:
+    for write_thread in write_threads:
+      write_queue.put(END)
+    for write_thread in write_threads:
+      write_thread.join()
+  while pending:
+    report_oldest()
+  stats.finish()
+  if read_error is not None:
+    raise read_error
+  return results, stats
+
+def overlap_csv(csv_file, out_dir=None, options=None, writers=DEFAULT_WRITERS,
+    queue_size=DEFAULT_QUEUE_SIZE, cache=None, only=None, profile=None, keep_parsed=False):
+  """
+    Draws every group of the given csv file (or just the `only` ones), like
+    graphs.render_csv() but with the stages overlapped.
+    Returns a [group name, output file, error] list for each group and the
+    OverlapStats of the run.
+  """
+  options, groups = graphs.csv_render_groups(csv_file, out_dir, options, only, keep_parsed)
+  return overlap_groups(groups, options, writers, queue_size, cache, profile)
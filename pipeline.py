@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# pipeline.py
+# Last Updated:
+# Purpose: Writes the graphs to a stream (eg: stdout) instead of files, so
+#          graphs.py can sit in a pipeline: ./graphs.py - --pipe tar < in.csv
+#          Each group is drawn in memory and written out as soon as it is
+#          done, in one of these formats:
+#          - tar: a tar stream with a member per graph
+#          - length: per graph, a 4 byte name length and an 8 byte document
+#                    length (both big endian), then the name (utf-8) and the
+#                    document itself
+# Notes:
+#       - Nothing but the graphs is written to the stream
+#
+import contextlib # for keeping the messages off the stream
+import io       # for drawing in memory
+import struct   # for the length prefixes
+import sys      # for reporting errors
+import tarfile  # for the tar headers
+import time     # for the tar member times
+
+import graphs
+import svg_writer
+
+TAR_BLOCK_SIZE = 512
+LENGTH_HEADER = struct.Struct(">IQ") # name length, document length
+
+class TarOutput(object):
+  """
+    Writes every graph as a tar member. The headers are written by hand
+    instead of through tarfile.open(), so nothing is held back in a buffer
+    once a graph is written.
+  """
+  def __init__(self, out):
+    self.out = out
+
+  def write(self, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    self.out.write(info.tobuf())
+    self.out.write(data)
+    self.out.write(b"\0" * (-len(data) % TAR_BLOCK_SIZE))
+    self.out.flush()
+
+  def close(self):
+    # The end of the archive is marked by two empty blocks
+    self.out.write(b"\0" * (TAR_BLOCK_SIZE * 2))
+    self.out.flush()
+
+class LengthOutput(object):
+  """
+    Writes every graph with its name and length in front of it
+  """
+  def __init__(self, out):
+    self.out = out
+
+  def write(self, name, data):
+    name = name.encode("utf-8")
+    self.out.write(LENGTH_HEADER.pack(len(name), len(data)))
+    self.out.write(name)
+    self.out.write(data)
+    self.out.flush()
+
+  def close(self):
+    self.out.flush()
+
+PIPE_FORMATS = {
+  "tar" : TarOutput,
+  "length" : LengthOutput,
+}
+
+def draw_document(dataset, options=None):
+  """
+    Draws the given group in memory.
+    Returns the name of its graph file and its contents.
+  """
+  options = dict(options or {})
+  options.pop("out_dir", None) # the names in the stream have no directory
+  svg = io.StringIO()
+  graphs.draw_rect_graph(dataset, dict(options, output=svg))
+  data = svg.getvalue().encode("utf-8")
+  if options.get("svgz"):
+    data = svg_writer.gzip_bytes(data)
+  return graphs.output_name(dataset.config, options), data
+
+def pipe_groups(groups, out, pipe_format="tar", options=None):
+  """
+    Draws the given groups one at a time and writes each one to the given
+    binary stream as soon as it is drawn. What the drawing prints goes to
+    stderr, so the stream only holds the graphs.
+    A group that fails is reported and left out of the stream.
+    Returns a [group name, graph name, error] list for each group.
+  """
+  if pipe_format not in PIPE_FORMATS:
+    raise ValueError("unknown pipe format: " + str(pipe_format))
+  stream = PIPE_FORMATS[pipe_format](out)
+  results = []
+  with contextlib.redirect_stdout(sys.stderr):
+    for dataset in groups:
+      name = dataset.config["filename"]
+      try:
+        file_name, data = draw_document(dataset, options)
+      except Exception as error:
+        error = "%s: %s" % (type(error).__name__, error)
+        print("Failed to render", name + ":", error, file=sys.stderr)
+        results.append([name, None, error])
+        continue
+      stream.write(file_name, data)
+      results.append([name, file_name, None])
+  stream.close()
+  return results
+
+def pipe_csv(csv_file, out, pipe_format="tar", options=None, only=None):
+  """
+    Draws every group of the given csv file ("-" for stdin), or just the
+    `only` ones, into the given binary stream.
+    Returns a [group name, graph name, error] list for each group.
+  """
+  return pipe_groups(graphs.csv_groups(csv_file, only), out, pipe_format, options)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# profiling.py
+# Last Updated:
+# Purpose: Per group timings of where a render spends its time:
+#          - read: parsing the group out of the CSV file
+#          - geometry: slice degrees and line points (incl. downsampling)
+#          - draw: making the elements in the writer backend
+#          - save: writing the file out (writer.close())
+#          plus the number of elements, bytes written and tracemalloc peak.
+# Notes:
+#       - Nothing here is used unless a RunProfile is handed to the renderer
+#
+import contextlib # for the stage timers
+import json     # for the report
+import os       # for the output sizes
+import time     # for the timings
+
+class GroupProfile(object):
+  """
+    Timings and counts of one rendered group
+  """
+  __slots__ = ("name", "seconds", "stages", "elements", "bytes_written",
+    "peak_memory", "trace_memory")
+
+  def __init__(self, name, trace_memory=False):
+    self.name = name
+    self.seconds = 0.0
+    self.stages = {"read" : 0.0, "geometry" : 0.0, "save" : 0.0}
+    self.elements = 0
+    self.bytes_written = 0
+    self.peak_memory = None
+    self.trace_memory = trace_memory
+
+  @contextlib.contextmanager
+  def stage(self, stage_name):
+    """
+      Adds the time spent in the with block to the given stage
+    """
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.stages[stage_name] = self.stages.get(stage_name, 0.0) + time.perf_counter() - start
+
+  @contextlib.contextmanager
+  def measure(self):
+    """
+      Measures the whole render of the group, and its peak memory if asked
+    """
+    if self.trace_memory:
+      import tracemalloc
+      if not tracemalloc.is_tracing():
+        tracemalloc.start()
+      tracemalloc.reset_peak()
+    start = time.perf_counter()
+    try:
+      yield
+    finally:
+      self.seconds += time.perf_counter() - start
+      if self.trace_memory:
+        self.peak_memory = tracemalloc.get_traced_memory()[1]
+
+  def wrap_writer(self, writer, output):
+    """
+      Returns the given writer backend, counting what goes through it
+    """
+    return ProfiledWriter(writer, output, self)
+
+  def to_json(self):
+    stages = dict(self.stages)
+    # Whatever the render did besides the geometry and saving is drawing
+    stages["draw"] = max(self.seconds - stages["geometry"] - stages["save"], 0.0)
+    return {
+      "name" : self.name,
+      "seconds" : self.seconds + stages["read"],
+      "stages" : stages,
+      "elements" : self.elements,
+      "bytes_written" : self.bytes_written,
+      "peak_memory_bytes" : self.peak_memory,
+    }
+
+class ProfiledWriter(object):
+  """
+    Passes everything on to a writer backend while counting the elements,
+    timing the save and measuring the file written
+  """
+  def __init__(self, writer, output, profile):
+    self.writer = writer
+    self.output = output
+    self.profile = profile
+
+  def rect(self, *args, **kwargs):
+    self.profile.elements += 1
+    self.writer.rect(*args, **kwargs)
+
+  def circle(self, *args, **kwargs):
+    self.profile.elements += 1
+    self.writer.circle(*args, **kwargs)
+
+  def path(self, *args, **kwargs):
+    self.profile.elements += 1
+    self.writer.path(*args, **kwargs)
+
+  def polyline(self, *args, **kwargs):
+    self.profile.elements += 1
+    self.writer.polyline(*args, **kwargs)
+
+  def arc(self, *args, **kwargs):
+    self.profile.elements += 1
+    self.writer.arc(*args, **kwargs)
+
+  def begin_group(self, **attributes):
+    self.profile.elements += 1
+    self.writer.begin_group(**attributes)
+
+  def end_group(self):
+    self.writer.end_group()
+
+  def discard(self):
+    self.writer.discard()
+
+  def close(self):
+    with self.profile.stage("save"):
+      self.writer.close()
+    if isinstance(self.output, str) and os.path.isfile(self.output):
+      self.profile.bytes_written += os.path.getsize(self.output)
+
+class RunProfile(object):
+  """
+    Profiles of every group in a run
+  """
+  def __init__(self, trace_memory=False):
+    self.trace_memory = trace_memory
+    self.groups = []
+    self.started = time.perf_counter()
+
+  def timed_groups(self, groups):
+    """
+      Yields the given datasets with a fresh GroupProfile, timing how long
+      each one took to read
+    """
+    iterator = iter(groups)
+    while True:
+      start = time.perf_counter()
+      try:
+        dataset = next(iterator)
+      except StopIteration:
+        return
+      group_profile = GroupProfile(dataset.config["filename"], self.trace_memory)
+      group_profile.stages["read"] = time.perf_counter() - start
+      yield dataset, group_profile
+
+  def add(self, group_profile):
+    self.groups.append(group_profile)
+
+  def to_json(self):
+    groups = [group_profile.to_json() for group_profile in self.groups]
+    totals = {"elements" : 0, "bytes_written" : 0, "stages" : {}}
+    for group in groups:
+      totals["elements"] += group["elements"]
+      totals["bytes_written"] += group["bytes_written"]
+      for stage_name, seconds in group["stages"].items():
+        totals["stages"][stage_name] = totals["stages"].get(stage_name, 0.0) + seconds
+    return {
+      "wall_seconds" : time.perf_counter() - self.started,
+      "totals" : totals,
+      "groups" : groups,
+    }
+
+  def dump(self, file_name):
+    with open(file_name, "w") as profile_output:
+      json.dump(self.to_json(), profile_output, indent=2)
+      profile_output.write("\n")
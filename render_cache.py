@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# render_cache.py
+# Last Updated:
+# Purpose: On-disk cache of rendered graphs, so groups that haven't changed
+#          since the last run don't have to be drawn again.
+# Notes:
+#       - Entries are named after a hash of everything that goes into a graph
+#       - The least recently used entries are removed once the cache gets
+#         bigger than its size limit
+#
+import hashlib  # for the cache keys
+import filecmp  # for checking if an output is still the cached one
+import json     # for hashing the group data
+import os       # for file checking
+import shutil   # for copying files in and out of the cache
+
+DEFAULT_CACHE_SIZE = 256 * 1024 * 1024 # bytes
+
+class RenderCache(object):
+  """
+    Content addressed cache of rendered files with LRU eviction
+  """
+  def __init__(self, directory, max_size=DEFAULT_CACHE_SIZE, force=False):
+    self.directory = directory
+    self.max_size = max_size
+    self.force = force # render everything again, but still refresh the cache
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(directory, exist_ok=True)
+
+    # Keep track of the entries in memory, so the directory is listed only once
+    self.entries = {}
+    self.total_size = 0
+    for entry_name in os.listdir(directory):
+      if entry_name.startswith("."):
+        continue # unfinished entry from a run that was stopped
+      stat = os.stat(os.path.join(directory, entry_name))
+      self.entries[entry_name] = [stat.st_mtime_ns, stat.st_size]
+      self.total_size += stat.st_size
+    self.evict() # in case the size limit went down since the last run
+
+  def key(self, *parts):
+    """
+      Returns the cache key of the given JSON serializable parts
+    """
+    data = json.dumps(parts, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+  def entry_keys(self, key, companions):
+    """
+      Returns the entry key of the output file and of every companion file
+      (eg: a slice table) that is drawn along with it
+    """
+    return [key] + ["%s.%d" % (key, index) for index in range(1, len(companions) + 1)]
+
+  def restore(self, key, output_name, companions=()):
+    """
+      Checks the cache for the given key.
+      On a hit the output file (and its companion files) are left untouched
+      if they still match the cached ones, otherwise they are copied back
+      from the cache.
+      Returns True on a hit.
+    """
+    entry_keys = self.entry_keys(key, companions)
+    if self.force or any(entry_key not in self.entries for entry_key in entry_keys):
+      self.misses += 1
+      return False
+
+    for entry_key, file_name in zip(entry_keys, [output_name] + list(companions)):
+      entry_path = os.path.join(self.directory, entry_key)
+      if not os.path.isfile(file_name) or not filecmp.cmp(entry_path, file_name, shallow=False):
+        shutil.copyfile(entry_path, file_name)
+
+      # Mark the entry as recently used
+      os.utime(entry_path)
+      self.entries[entry_key][0] = os.stat(entry_path).st_mtime_ns
+    self.hits += 1
+    return True
+
+  def store(self, key, output_name, companions=()):
+    """
+      Adds the given freshly rendered output file (and its companion files)
+      to the cache
+    """
+    for entry_key, file_name in zip(self.entry_keys(key, companions), [output_name] + list(companions)):
+      self.store_entry(entry_key, file_name)
+
+  def store_entry(self, key, output_name):
+    """
+      Adds a single file to the cache
+    """
+    entry_path = os.path.join(self.directory, key)
+    temp_path = os.path.join(self.directory, "." + key)
+    shutil.copyfile(output_name, temp_path)
+    os.replace(temp_path, entry_path)
+
+    if key in self.entries:
+      self.total_size -= self.entries[key][1]
+    stat = os.stat(entry_path)
+    self.entries[key] = [stat.st_mtime_ns, stat.st_size]
+    self.total_size += stat.st_size
+    self.evict()
+
+  def evict(self):
+    """
+      Removes the least recently used entries until the cache fits its limit
+    """
+    if self.total_size <= self.max_size:
+      return
+    for key in sorted(self.entries, key=lambda entry_key: self.entries[entry_key][0]):
+      if self.total_size <= self.max_size:
+        break
+      try:
+        os.remove(os.path.join(self.directory, key))
+      except FileNotFoundError:
+        pass
+      self.total_size -= self.entries.pop(key)[1]
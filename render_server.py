@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# render_server.py
+# Last Updated:
+# Purpose: Small HTTP server that renders graphs for other programs, without
+#          starting a new Python process (and importing svgwrite) for every
+#          graph. The graphs are drawn by a pool of worker processes that are
+#          started and warmed up when the server starts, and the responses
+#          are kept in an in-memory LRU cache keyed by a hash of the request.
+# Program Uses: ./render_server.py --port 8765 --jobs 4
+#   POST /render   CSV text (the same layout as the csv files), returns the
+#                  SVG of the group, or a tar of every graph when there is more
+#                  than one. ?group=NAME picks a single group, ?writer=KIND
+#                  picks the writer backend.
+#   POST /render   JSON {"config": {...}, "colors": [...], "series": [[...]],
+#                  "options": {...}} (a parsed group, like Dataset.to_json()),
+#                  returns its SVG
+#   GET /stats     JSON request, latency and cache numbers
+# Notes:
+#       - Only listens on 127.0.0.1
+#
+import argparse # for the command line options
+import collections # for the LRU cache and the latencies
+import concurrent.futures # for the worker pool
+import contextlib # for hiding what the graphs print
+import hashlib  # for the cache keys
+import http.server # for the server
+import io       # for the csv text
+import json     # for the requests and stats
+import threading # for the cache lock
+import time     # for the latencies
+import urllib.parse # for the query strings
+
+import graphs
+import pipeline
+
+DEFAULT_PORT = 8765
+DEFAULT_CACHE_SIZE = 64 * 1024 * 1024 # bytes
+LATENCY_SAMPLES = 1000 # latest requests the latency percentiles are taken from
+
+def flag(value):
+  """ Reads a true/false request option """
+  if isinstance(value, bool):
+    return value
+  return str(value).lower() in ("1", "true", "yes")
+
+# Options a request is allowed to set (the rest are about files on the
+# server), with how their values are read
+REQUEST_OPTIONS = {
+  "writer" : str,
+  "precision" : int,
+  "line_budget" : int,
+  "downsample" : str,
+  "dot_density" : float,
+  "bar_width" : int,
+  "bar_aggregate" : str,
+  "min_slice" : float,
+  "top_slices" : int,
+  "other_color" : str,
+  "templates" : flag,
+}
+
+def warm_up():
+  """
+    Runs in every worker process as it starts, so the first request doesn't
+    pay for the imports
+  """
+  import svg_writer
+  try:
+    import svgwrite
+  except ImportError:
+    pass # only needed by the svgwrite writer backend
+
+def draw_datasets(datasets, options):
+  """
+    Draws the given groups in memory.
+    Returns a [file name, SVG bytes] list for each group.
+  """
+  documents = []
+  with contextlib.redirect_stdout(io.StringIO()):
+    for dataset in datasets:
+      documents.append(list(pipeline.draw_document(dataset, options)))
+  return documents
+
+def render_csv_text(text, group, options):
+  """
+    Worker job: draws the groups of the given csv text, or just the one
+    named `group`
+  """
+  datasets = list(graphs.stream_groups(io.StringIO(text, newline="")))
+  if group is not None:
+    datasets = [dataset for dataset in datasets if dataset.config["filename"] == group]
+    if not datasets:
+      raise LookupError("No group named " + group)
+  return draw_datasets(datasets, options)
+
+def render_json(payload, options):
+  """
+    Worker job: draws the group given as Dataset.to_json() data
+  """
+  dataset = graphs.Dataset(dict(payload["config"]))
+  for color, values in zip(payload["colors"], payload["series"]):
+    dataset.add_series(color, values)
+  return draw_datasets([dataset], options)
+
+class ResponseCache(object):
+  """
+    In-memory LRU cache of response bodies, limited by their total size
+  """
+  def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+    self.max_size = max_size
+    self.entries = collections.OrderedDict() # key -> (content type, body)
+    self.size = 0
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      entry = self.entries.get(key)
+      if entry is None:
+        self.misses += 1
+        return None
+      self.entries.move_to_end(key)
+      self.hits += 1
+      return entry
+
+  def put(self, key, content_type, body):
+    with self.lock:
+      if key in self.entries or len(body) > self.max_size:
+        return
+      self.entries[key] = (content_type, body)
+      self.size += len(body)
+      while self.size > self.max_size:
+        old_key, (old_type, old_body) = self.entries.popitem(last=False)
+        self.size -= len(old_body)
+
+class Stats(object):
+  """
+    Request counts and latencies of the server
+  """
+  def __init__(self):
+    self.started = time.time()
+    self.requests = 0
+    self.errors = 0
+    self.latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+    self.lock = threading.Lock()
+
+  def add(self, seconds, error=False):
+    with self.lock:
+      self.requests += 1
+      self.errors += error
+      self.latencies.append(seconds)
+
+  def to_json(self, cache):
+    with self.lock:
+      latencies = sorted(self.latencies)
+      requests, errors = self.requests, self.errors
+    def percentile(share):
+      if not latencies:
+        return None
+      return latencies[min(int(len(latencies) * share), len(latencies) - 1)] * 1000
+    return {
+      "uptime_seconds" : time.time() - self.started,
+      "requests" : requests,
+      "errors" : errors,
+      "latency_ms" : {
+        "mean" : sum(latencies) / len(latencies) * 1000 if latencies else None,
+        "p50" : percentile(0.5),
+        "p95" : percentile(0.95),
+        "max" : latencies[-1] * 1000 if latencies else None,
+      },
+      "cache" : {
+        "hits" : cache.hits,
+        "misses" : cache.misses,
+        "entries" : len(cache.entries),
+        "bytes" : cache.size,
+      },
+    }
+
+class RenderHandler(http.server.BaseHTTPRequestHandler):
+  """
+    Answers the /render and /stats requests
+  """
+  server_version = "graphs-render/1"
+
+  def log_message(self, format, *args):
+    pass # the stats endpoint says how the server is doing
+
+  def send_body(self, status, content_type, body):
+    self.send_response(status)
+    self.send_header("Content-Type", content_type)
+    self.send_header("Content-Length", str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+  def send_error_text(self, status, message):
+    self.send_body(status, "text/plain; charset=utf-8", (message + "\n").encode("utf-8"))
+
+  def do_GET(self):
+    if urllib.parse.urlsplit(self.path).path != "/stats":
+      self.send_error_text(404, "Not found")
+      return
+    stats = self.server.stats.to_json(self.server.cache)
+    self.send_body(200, "application/json", json.dumps(stats, indent=2).encode("utf-8"))
+
+  def do_POST(self):
+    start = time.perf_counter()
+    url = urllib.parse.urlsplit(self.path)
+    if url.path != "/render":
+      self.send_error_text(404, "Not found")
+      return
+    body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+    content_type = self.headers.get("Content-Type", "text/csv").split(";")[0].strip()
+
+    key = hashlib.sha256(b"\0".join([url.query.encode("utf-8"), content_type.encode("utf-8"),
+      body])).hexdigest()
+    cached = self.server.cache.get(key)
+    if cached is not None:
+      self.send_body(200, cached[0], cached[1])
+      self.server.stats.add(time.perf_counter() - start)
+      return
+
+    try:
+      response_type, response = self.render(url, content_type, body)
+    except LookupError as error:
+      self.send_error_text(404, str(error))
+      self.server.stats.add(time.perf_counter() - start, True)
+      return
+    except Exception as error:
+      self.send_error_text(400, "%s: %s" % (type(error).__name__, error))
+      self.server.stats.add(time.perf_counter() - start, True)
+      return
+    self.server.cache.put(key, response_type, response)
+    self.send_body(200, response_type, response)
+    self.server.stats.add(time.perf_counter() - start)
+
+  def render(self, url, content_type, body):
+    """
+      Draws the graphs of the request in the worker pool.
+      Returns the content type and body of the response.
+    """
+    query = dict(urllib.parse.parse_qsl(url.query))
+    options = dict(self.server.options)
+    if content_type == "application/json":
+      payload = json.loads(body.decode("utf-8"))
+      options.update(request_options(payload.get("options", {})))
+      future = self.server.pool.submit(render_json, payload, options)
+    else:
+      options.update(request_options({key : value for key, value in query.items() if key != "group"}))
+      future = self.server.pool.submit(render_csv_text, body.decode("utf-8"), query.get("group"), options)
+    documents = future.result()
+
+    if len(documents) == 1:
+      return "image/svg+xml", documents[0][1]
+    tar = io.BytesIO()
+    stream = pipeline.TarOutput(tar)
+    for file_name, data in documents:
+      stream.write(file_name, data)
+    stream.close()
+    return "application/x-tar", tar.getvalue()
+
+def request_options(requested):
+  """
+    Returns the options of a request, checked against REQUEST_OPTIONS
+  """
+  options = {}
+  for key, value in requested.items():
+    if key not in REQUEST_OPTIONS:
+      raise ValueError("unknown option: " + key)
+    options[key] = None if value is None else REQUEST_OPTIONS[key](value)
+  return options
+
+class RenderServer(http.server.ThreadingHTTPServer):
+  """
+    HTTP server with the worker pool, response cache and stats of the renders
+  """
+  daemon_threads = True
+
+  def __init__(self, port=DEFAULT_PORT, jobs=2, cache_size=DEFAULT_CACHE_SIZE, options=None):
+    http.server.ThreadingHTTPServer.__init__(self, ("127.0.0.1", port), RenderHandler)
+    self.options = dict(options or {})
+    self.cache = ResponseCache(cache_size)
+    self.stats = Stats()
+    self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=jobs, initializer=warm_up)
+    # Start every worker now instead of on the first requests
+    for future in [self.pool.submit(time.sleep, 0.01) for job in range(0, jobs)]:
+      future.result()
+
+  def server_close(self):
+    http.server.ThreadingHTTPServer.server_close(self)
+    self.pool.shutdown()
+
+def main(argv=None):
+  """
+    Command line interface
+  """
+  parser = argparse.ArgumentParser(description="Serves graphs.py renders on 127.0.0.1")
+  parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="port to listen on")
+  parser.add_argument("--jobs", "-j", metavar="N", type=int, default=2,
+    help="number of worker processes")
+  parser.add_argument("--cache-size", metavar="MB", type=float, default=64,
+    help="size limit of the response cache")
+  parser.add_argument("--writer", default="stream",
+    help="writer backend used when a request doesn't pick one")
+  args = parser.parse_args(argv)
+
+  server = RenderServer(args.port, args.jobs, int(args.cache_size * 1024 * 1024),
+    {"writer" : args.writer})
+  print("Serving on http://127.0.0.1:%d (POST /render, GET /stats)" % server.server_address[1])
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.server_close()
+  return 0
+
+if __name__ == "__main__":
+  exit(main())
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# shards.py
+# Last Updated:
+# Purpose: Renders a CSV file that is too big for one machine on several of
+#          them, through a directory they all share (no coordinator needed):
+#          - plan: splits the groups into N shards of about the same number of
+#                  bytes or points, and writes the manifest
+#          - render: renders one shard (--shard K), or keeps claiming the next
+#                    shard nobody took yet (--next), and writes its report
+#          - merge: checks that every shard was rendered and every graph file
+#                   exists, and writes the combined report
+# Program Uses: ./shards.py plan big.csv SHARED_DIR --shards 8
+#               ./shards.py render SHARED_DIR --next   (on every machine)
+#               ./shards.py merge SHARED_DIR
+# Notes:
+#       - The shards are read with the group index, so a machine only reads
+#         the bytes of its own groups
+#       - A shard is claimed by creating "shard-K.claim" with O_EXCL, which is
+#         atomic on a local or NFS (v3+) file system
+#
+import argparse # for the command line options
+import heapq    # for balancing the shards
+import json     # for the manifest and reports
+import os       # for file checking
+import socket   # for the host name in the reports
+import sys      # for reporting errors
+import time     # for the reports
+
+import graphs
+import group_index
+
+MANIFEST_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+REPORT_NAME = "report.json"
+
+def write_json(file_name, data):
+  """
+    Writes the given data as JSON, through a temporary file so nobody reads
+    it half written
+  """
+  temp_name = "%s.%d.tmp" % (file_name, os.getpid())
+  with open(temp_name, "w") as json_output:
+    json.dump(data, json_output, indent=1)
+    json_output.write("\n")
+  os.replace(temp_name, file_name)
+
+def read_json(file_name):
+  with open(file_name, "r") as json_input:
+    return json.load(json_input)
+
+def shard_report_name(shared_dir, shard):
+  return os.path.join(shared_dir, "shard-%d.json" % shard)
+
+def shard_claim_name(shared_dir, shard):
+  return os.path.join(shared_dir, "shard-%d.claim" % shard)
+
+def plan_shards(csv_file, shared_dir, shards, balance="bytes", options=None):
+  """
+    Splits the groups of the given csv file into the given number of shards,
+    balanced by "bytes" or "points", and writes the manifest.
+    Returns the manifest.
+  """
+  entries = group_index.load_group_index(csv_file)
+  weight_key = "length" if balance == "bytes" else "points"
+
+  # Biggest groups first, each to the lightest shard so far
+  heap = [(0, shard, []) for shard in range(0, shards)]
+  for position in sorted(range(0, len(entries)), key=lambda position: -entries[position][weight_key]):
+    weight, shard, positions = heapq.heappop(heap)
+    positions.append(position)
+    heapq.heappush(heap, (weight + entries[position][weight_key], shard, positions))
+
+  stat = os.stat(csv_file)
+  manifest = {
+    "version" : MANIFEST_VERSION,
+    "csv" : os.path.abspath(csv_file),
+    "size" : stat.st_size,
+    "mtime_ns" : stat.st_mtime_ns,
+    "balance" : balance,
+    "options" : dict(options or {}),
+    "shards" : [],
+  }
+  for weight, shard, positions in sorted(heap, key=lambda item: item[1]):
+    manifest["shards"].append({
+      "shard" : shard,
+      "weight" : weight,
+      "groups" : [entries[position] for position in sorted(positions)], # in file order
+    })
+
+  os.makedirs(shared_dir, exist_ok=True)
+  write_json(os.path.join(shared_dir, MANIFEST_NAME), manifest)
+  return manifest
+
+def load_manifest(shared_dir, csv_file=None):
+  """
+    Returns the manifest of the given shared directory, checking that the
+    csv file (at its planned path, or the given one) hasn't changed since
+  """
+  manifest = read_json(os.path.join(shared_dir, MANIFEST_NAME))
+  if manifest["version"] != MANIFEST_VERSION:
+    raise ValueError("unknown manifest version: " + str(manifest["version"]))
+  if csv_file is not None:
+    manifest["csv"] = csv_file
+  stat = os.stat(manifest["csv"])
+  if stat.st_size != manifest["size"] or stat.st_mtime_ns != manifest["mtime_ns"]:
+    raise ValueError(manifest["csv"] + " changed since the shards were planned")
+  return manifest
+
+def shard_groups(manifest, shard):
+  """
+    Yields the groups of the given shard, reading only their bytes
+  """
+  for entry in manifest["shards"][shard]["groups"]:
+    yield from graphs.parse_groups(group_index.read_group_lines(manifest["csv"], entry))
+
+def render_shard(shared_dir, shard, jobs=1, csv_file=None, claimed=False):
+  """
+    Renders the given shard and writes its report. A group that fails is
+    recorded in the report; if the shard itself can't be rendered (eg: the
+    csv file changed) and it was claimed with claim_shard(), its claim is
+    given back so it can be rendered again.
+    Returns the report.
+  """
+  import profiling
+  try:
+    manifest = load_manifest(shared_dir, csv_file)
+    if not 0 <= shard < len(manifest["shards"]):
+      raise ValueError("no shard %d, the plan has %d shards" % (shard, len(manifest["shards"])))
+    options = dict(manifest["options"])
+    if options.get("out_dir"):
+      os.makedirs(options["out_dir"], exist_ok=True)
+
+    profile = profiling.RunProfile()
+    started = time.time()
+    results = graphs.render_groups(shard_groups(manifest, shard), options, jobs, profile=profile)
+  except BaseException:
+    if claimed:
+      release_shard(shared_dir, shard)
+    raise
+  report = {
+    "shard" : shard,
+    "host" : socket.gethostname(),
+    "pid" : os.getpid(),
+    "started" : started,
+    "seconds" : time.time() - started,
+    "results" : results,
+    "profile" : profile.to_json(),
+  }
+  write_json(shard_report_name(shared_dir, shard), report)
+  return report
+
+def claim_shard(shared_dir, shards):
+  """
+    Claims the first shard that nobody claimed yet.
+    Returns its number, or None once every shard is taken.
+  """
+  for shard in range(0, shards):
+    try:
+      claim = os.open(shard_claim_name(shared_dir, shard), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+      continue
+    os.write(claim, ("%s %d\n" % (socket.gethostname(), os.getpid())).encode("utf-8"))
+    os.close(claim)
+    return shard
+  return None
+
+def release_shard(shared_dir, shard):
+  """
+    Gives back the claim of the given shard, so --next can pick it up again
+  """
+  try:
+    os.remove(shard_claim_name(shared_dir, shard))
+  except FileNotFoundError:
+    pass
+
+def merge_shards(shared_dir):
+  """
+    Checks the reports of every shard and the graph files of every group,
+    and writes the combined report.
+    Returns the combined report.
+  """
+  manifest = read_json(os.path.join(shared_dir, MANIFEST_NAME))
+  options = manifest["options"]
+  report = {
+    "csv" : manifest["csv"],
+    "shards" : [],
+    "missing_shards" : [],
+    "missing_outputs" : [],
+    "failed_groups" : [],
+    "groups" : 0,
+    "totals" : {"elements" : 0, "bytes_written" : 0, "stages" : {}},
+  }
+  for planned in manifest["shards"]:
+    shard = planned["shard"]
+    for entry in planned["groups"]:
+      report["groups"] += 1
+      output = graphs.output_name({"filename" : entry["name"]}, options)
+      if not os.path.isfile(output):
+        report["missing_outputs"].append(output)
+    try:
+      shard_report = read_json(shard_report_name(shared_dir, shard))
+    except OSError:
+      report["missing_shards"].append(shard)
+      continue
+
+    report["shards"].append({
+      "shard" : shard,
+      "host" : shard_report["host"],
+      "seconds" : shard_report["seconds"],
+      "groups" : len(shard_report["results"]),
+      "weight" : planned["weight"],
+    })
+    for name, output, error in shard_report["results"]:
+      if error is not None:
+        report["failed_groups"].append({"name" : name, "shard" : shard, "error" : error})
+    totals = shard_report["profile"]["totals"]
+    report["totals"]["elements"] += totals["elements"]
+    report["totals"]["bytes_written"] += totals["bytes_written"]
+    for stage_name, seconds in totals["stages"].items():
+      report["totals"]["stages"][stage_name] = report["totals"]["stages"].get(stage_name, 0.0) + seconds
+
+  report["complete"] = not (report["missing_shards"] or report["missing_outputs"]
+    or report["failed_groups"])
+  write_json(os.path.join(shared_dir, REPORT_NAME), report)
+  return report
+
+def main(argv=None):
+  """
+    Command line interface
+  """
+  parser = argparse.ArgumentParser(description="Renders a CSV file in shards through a shared directory")
+  commands = parser.add_subparsers(dest="command", required=True)
+
+  plan = commands.add_parser("plan", help="split the groups into shards and write the manifest")
+  plan.add_argument("csv_file", help="CSV file to render")
+  plan.add_argument("shared_dir", help="directory every machine can reach")
+  plan.add_argument("--shards", metavar="N", type=graphs.positive_int, required=True, help="number of shards")
+  plan.add_argument("--balance", choices=["bytes", "points"], default="bytes",
+    help="what the shards are balanced on")
+  plan.add_argument("--out-dir", metavar="DIR",
+    help="directory the graphs are written to (default: SHARED_DIR/out)")
+  plan.add_argument("--writer", choices=sorted(graphs.svg_writer.WRITERS), default="svgwrite",
+    help="writer backend the graphs are drawn with")
+
+  render = commands.add_parser("render", help="render a shard")
+  render.add_argument("shared_dir", help="directory the shards were planned in")
+  which = render.add_mutually_exclusive_group(required=True)
+  which.add_argument("--shard", metavar="K", type=int, help="render shard K")
+  which.add_argument("--next", action="store_true",
+    help="keep claiming and rendering the shards nobody took yet")
+  render.add_argument("--jobs", "-j", metavar="N", type=int, default=1,
+    help="render the groups with N worker processes")
+  render.add_argument("--csv", metavar="FILE",
+    help="where the csv file is on this machine, if not at its planned path")
+
+  merge = commands.add_parser("merge", help="check every shard and write the combined report")
+  merge.add_argument("shared_dir", help="directory the shards were planned in")
+  args = parser.parse_args(argv)
+
+  if args.command == "plan":
+    out_dir = args.out_dir or os.path.join(args.shared_dir, "out")
+    manifest = plan_shards(args.csv_file, args.shared_dir, args.shards, args.balance,
+      {"writer" : args.writer, "out_dir" : os.path.abspath(out_dir)})
+    for shard in manifest["shards"]:
+      print("Shard %d: %d groups, %d %s" % (shard["shard"], len(shard["groups"]),
+        shard["weight"], args.balance))
+    return 0
+
+  if args.command == "render":
+    try:
+      if args.shard is not None:
+        shards = [args.shard]
+      else:
+        manifest = load_manifest(args.shared_dir, args.csv)
+        shards = iter(lambda: claim_shard(args.shared_dir, len(manifest["shards"])), None)
+      failed = False
+      for shard in shards:
+        print("=== Shard", shard)
+        report = render_shard(args.shared_dir, shard, args.jobs, args.csv, claimed=args.next)
+        failed = failed or any(error is not None for name, output, error in report["results"])
+    except (OSError, ValueError) as error:
+      print(error, file=sys.stderr)
+      return 1
+    return 1 if failed else 0
+
+  report = merge_shards(args.shared_dir)
+  print("Merged %d shards, %d groups" % (len(report["shards"]), report["groups"]))
+  for shard in report["missing_shards"]:
+    print("Missing shard:", shard)
+  for output in report["missing_outputs"]:
+    print("Missing file:", output)
+  for failed in report["failed_groups"]:
+    print("Failed group:", failed["name"], "(shard %d)" % failed["shard"])
+  return 0 if report["complete"] else 1
+
+if __name__ == "__main__":
+  exit(main())
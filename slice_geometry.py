@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# slice_geometry.py
+# Last Updated:
+# Purpose: Calculates the degrees and percentages of every pie/donut slice
+#          in a single pass over the data.
+# Notes:
+#       - Uses NumPy for large charts when it is installed (imported lazily)
+#       - The results are the same with or without NumPy
+#       - coalesce_slices() merges the small slices of charts with a lot of
+#         them into a single "other" slice
+#
+import heapq    # for the biggest slices
+
+from optional_numpy import load_numpy
+
+# Below this many slices the plain loop is faster than setting up NumPy
+NUMPY_MIN_SLICES = 256
+
+def slice_geometry(list_given):
+  """
+    Calculates the geometry of every slice from the total of the given list.
+    Returns a [isOverHalf, degree, percentage] list for each slice, where:
+      - isOverHalf is True if the slice takes up over 50% of the circle
+      - degree is cumulative, so index=1 has the degree of index=0 + index=1
+      - percentage is the rounded % that only the slice itself takes up
+  """
+  if len(list_given) >= NUMPY_MIN_SLICES and load_numpy():
+    return _numpy_slice_geometry(list_given)
+
+  total = 0
+  for num in list_given:
+    total += num # add all the list numbers
+
+  slices = []
+  divisor = 0
+  last_percentage = 0
+  for numerator in list_given:
+    divisor += numerator # get the sum up to the current slice
+    # Check if the current number is over 50%
+    isOverHalf = round((numerator / total)*100) > 50
+    degree = round((divisor / total)*360)
+    percentage = round(degree/3.6)
+    slices.append([isOverHalf, degree, percentage - last_percentage])
+    last_percentage = percentage
+  return slices
+
+def _numpy_slice_geometry(list_given):
+  """
+    Vectorized version of slice_geometry().
+    cumsum() adds the numbers in order, so the sums match the plain loop.
+  """
+  numpy = load_numpy()
+  numbers = numpy.asarray(list_given)
+  cumulative = numpy.cumsum(numbers)
+  total = cumulative[-1]
+  if total == 0:
+    raise ZeroDivisionError("the slice numbers add up to zero")
+
+  over_half = numpy.rint((numbers / total)*100) > 50
+  degrees = numpy.rint((cumulative / total)*360).astype(numpy.int64)
+  percentages = numpy.rint(degrees/3.6).astype(numpy.int64)
+  percentages[1:] -= percentages[:-1].copy()
+  return [list(item) for item in zip(over_half.tolist(), degrees.tolist(), percentages.tolist())]
+
+def coalesce_slices(numbers, colors, min_percentage=None, top=None, other_color="gray"):
+  """
+    Merges the small slices into a single "other" slice at the end:
+      - every slice under min_percentage % of the total (1% is 3.6 degrees)
+      - every slice but the `top` biggest ones
+    Returns the numbers, colors and labels of the slices that are left,
+    where the label is the 1 based index of the slice, or "other".
+  """
+  keep = [True] * len(numbers)
+  if top is not None and top < len(numbers):
+    keep = [False] * len(numbers)
+    for index in heapq.nlargest(top, range(len(numbers)), key=numbers.__getitem__):
+      keep[index] = True
+  total = sum(numbers)
+  if min_percentage and total:
+    for index, number in enumerate(numbers):
+      if number / total * 100 < min_percentage:
+        keep[index] = False
+
+  # Merging a single slice wouldn't leave any fewer of them
+  if keep.count(False) < 2:
+    return list(numbers), list(colors), list(range(1, len(numbers) + 1))
+
+  kept_numbers, kept_colors, labels = [], [], []
+  other = 0
+  for index, number in enumerate(numbers):
+    if keep[index]:
+      kept_numbers.append(number)
+      kept_colors.append(colors[index])
+      labels.append(index + 1)
+    else:
+      other += number
+  if other:
+    kept_numbers.append(other)
+    kept_colors.append(other_color)
+    labels.append("other")
+  return kept_numbers, kept_colors, labels
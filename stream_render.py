@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# stream_render.py
+# Last Updated:
+# Purpose: Draws rectangle graphs that are too big to load, one row (series)
+#          at a time straight from the csv file, so memory doesn't grow with
+#          the number of rows in the group.
+#          Every value of a row is turned into its coordinates once, and its
+#          bar, line point and dot go to three layer streams (buffered
+#          temporary files) that are joined in the usual order at the end:
+#          every bar, then every line, then every dot.
+# Notes:
+#       - The line offsets depend on how many rows the group has, which comes
+#         from the group index, so the rows are read only once
+#       - Memory still grows with the longest row, since a row is parsed (and
+#         its line drawn) as a whole
+#       - The output is the same as the stream (and svgwrite) writer, or the
+#         compact writer when it's picked
+#
+from array import array
+import csv      # for reading the rows
+import shutil   # for joining the layers
+import tempfile # for the layer streams
+
+import graphs
+import group_index
+import svg_writer
+from csv_values import parse_values # for the number columns
+from dataset import StreamedGroup
+
+class LayerStream(object):
+  """
+    Writer backend mixin that only writes elements, for one layer of a
+    graph that is joined with the other layers later
+  """
+  def write_header(self, width, height):
+    pass # the whole graph gets its header once the layers are joined
+
+  def write_footer(self):
+    pass
+
+class StreamLayer(LayerStream, svg_writer.StreamWriter):
+  pass
+
+class CompactLayer(LayerStream, svg_writer.CompactWriter):
+  pass
+
+# The svgwrite writer can't draw a piece at a time, so its groups are drawn by
+# the stream writer (which gives the same output)
+LAYER_WRITERS = {
+  "svgwrite" : ("stream", StreamLayer),
+  "stream" : ("stream", StreamLayer),
+  "compact" : ("compact", CompactLayer),
+}
+
+def read_config(csv_file, entry):
+  """
+    Returns the graph configuration from the header row of the given group
+  """
+  with open(csv_file, "rb") as csv_input:
+    csv_input.seek(entry["offset"])
+    header = csv_input.readline(entry["length"]).decode("utf-8")
+  row = next(csv.reader([header]), [])
+  if len(row) < 2 or row[1] != "r":
+    return None
+  return graphs.parse_config(row)
+
+def streamed_groups(csv_file, entries, stream_points):
+  """
+    Yields the groups of the given index entries: a StreamedGroup for the
+    rectangle graphs with more than stream_points points, a parsed Dataset
+    for the others
+  """
+  for entry in entries:
+    if entry["points"] > stream_points:
+      try:
+        config = read_config(csv_file, entry)
+      except ValueError:
+        config = None # parsed the usual way below, which reports the error
+      if config is not None:
+        yield StreamedGroup(config, csv_file, entry)
+        continue
+    yield from graphs.parse_groups(group_index.read_group_lines(csv_file, entry))
+
+def x_positions(rect_width):
+  """
+    Yields the x of every value, added up the same way draw_rect_graph() does
+  """
+  x_index = 0
+  while True:
+    yield x_index
+    x_index += rect_width
+
+def draw_streamed_group(group, options=None):
+  """
+    Draws the given StreamedGroup from its rows in the csv file
+  """
+  options = graphs.render_options(options)
+  config = group.config
+  kind, layer_class = LAYER_WRITERS[options["writer"]]
+  profile = options["profile"]
+
+  layers = []
+  try:
+    for layer_name in ("rect", "line", "dot"):
+      stream = tempfile.TemporaryFile(mode="w+", encoding="utf-8", buffering=svg_writer.WRITE_BUFFER_SIZE)
+      layer = layer_class(stream, precision=options["precision"])
+      layers.append((stream, layer if profile is None else profile.wrap_writer(layer, None)))
+    rects, lines, dots = [layer for stream, layer in layers]
+
+    show_rect = config["show_rect"] == "true"
+    show_line = config["show_line"] == "true"
+    rect_width = config["rect_width"]
+    # The lines start below every bar, so they need the number of rows up front
+    line_v_offset = config["v_offset"]
+    if show_rect:
+      for row_index in range(1, group.entry["rows"]):
+        line_v_offset += config["v_offset"]
+    rect_offset = config["v_offset"]
+    line_offset = line_v_offset
+
+    rows = csv.reader(group_index.iter_group_lines(group.csv_file, group.entry))
+    next(rows) # the header row
+    series_index = 0
+    for row in rows:
+      if len(row) < 2:
+        continue
+      color = row[0]
+      height_list = parse_values(row[1:])
+      draw_bars = show_rect and series_index > 0
+
+      if draw_bars and options["bar_width"] and len(height_list) - 1 > options["bar_width"]:
+        # More bars than pixels, so draw a bar per bin of values instead
+        with graphs.profile_stage(options, "geometry"):
+          bars = graphs.downsample.bin_bars(height_list[1:], options["bar_width"], options["bar_aggregate"])
+        for start, end, low, high in bars:
+          rects.rect((start * rect_width, -high + rect_offset),
+            ((end - start) * rect_width, high - low),
+            fill=color)
+        draw_bars = False
+
+      if show_line and (options["line_budget"] or options["dot_density"]):
+        # The line is downsampled or its dots may be left out, which both need
+        # the whole row, so the bars are drawn on their own
+        if draw_bars:
+          previous_x = None
+          for x_index, r_size in zip(x_positions(rect_width), height_list):
+            if previous_x is not None:
+              rects.rect((previous_x, -r_size + rect_offset), (rect_width, r_size), fill=color)
+            previous_x = x_index
+        with graphs.profile_stage(options, "geometry"):
+          points = graphs.line_points_of(height_list, config, options)
+        lines.polyline([(x_index, -r_size + line_offset) for x_index, r_size in points],
+          stroke=color, stroke_width=config["st_width"])
+        if not graphs.too_dense_for_dots(points, options):
+          for x_index, r_size in points:
+            dots.circle(center=(x_index, -r_size + line_offset), r=config["dot_radius"], fill=color)
+      elif draw_bars or show_line:
+        # Every value's bar (at the x of the value before it), line point and
+        # dot in a single pass
+        line_heights = array("d")
+        previous_x = None
+        for x_index, r_size in zip(x_positions(rect_width), height_list):
+          if draw_bars and previous_x is not None:
+            rects.rect((previous_x, -r_size + rect_offset), (rect_width, r_size), fill=color)
+          if show_line:
+            y_index = -r_size + line_offset
+            line_heights.append(y_index)
+            dots.circle(center=(x_index, y_index), r=config["dot_radius"], fill=color)
+          previous_x = x_index
+        if show_line:
+          lines.polyline(zip(x_positions(rect_width), line_heights),
+            stroke=color, stroke_width=config["st_width"])
+
+      if show_rect and series_index > 0:
+        rect_offset += config["v_offset"]
+      if show_line:
+        line_offset += line_v_offset
+      series_index += 1
+
+    if series_index != group.entry["rows"]:
+      raise ValueError("%s changed since its group index was made" % group.csv_file)
+
+    # Join the layers into the graph file
+    output = options["output"]
+    if output is None:
+      output = graphs.output_name(config, options)
+    document = svg_writer.open_writer(kind, output, precision=options["precision"])
+    writer = document if profile is None else profile.wrap_writer(document, output)
+    try:
+      for stream, layer in layers:
+        layer.close()
+        stream.seek(0)
+        shutil.copyfileobj(stream, document.out)
+    except BaseException:
+      writer.discard()
+      raise
+    writer.close()
+  finally:
+    for stream, layer in layers:
+      stream.close()
+  print("Exported file:", graphs.output_name(config, options))
@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# svg_writer.py
+# Last Updated:
+# Purpose: Writer backends that the graphs are drawn through.
+#          - svgwrite: builds the whole svgwrite drawing, then saves it. Every
+#                      value is validated on the way.
+#          - stream: writes each element straight to a buffered file as soon
+#                    as it is drawn, so memory doesn't grow with the number of
+#                    elements. The output is the same as the svgwrite one.
+#          - compact: streams a smaller file. Dots are <use> references to a
+#                     shared dot per color, bars of the same color are merged
+#                     into one path, coordinates are rounded to `precision`
+#                     decimals and paths use relative commands.
+# Notes:
+#       - svgwrite is only imported when the svgwrite backend is used
+#       - Output file names ending in .svgz are gzipped
+#       - Files are written next to the output and renamed over it once
+#         complete, so a failed drawing never leaves a half written graph
+#
+import io       # for the gzipped text files
+import os       # for the atomic renames
+import threading # for the temporary file names
+
+WRITE_BUFFER_SIZE = 1 << 16
+
+SVG_NAMESPACES = 'xmlns="http://www.w3.org/2000/svg" ' \
+  'xmlns:ev="http://www.w3.org/2001/xml-events" ' \
+  'xmlns:xlink="http://www.w3.org/1999/xlink"'
+
+DEFAULT_PRECISION = 2
+
+def escape_attribute(value):
+  """
+    Escapes a string the same way ElementTree does for attribute values
+  """
+  if "&" in value:
+    value = value.replace("&", "&amp;")
+  if "<" in value:
+    value = value.replace("<", "&lt;")
+  if ">" in value:
+    value = value.replace(">", "&gt;")
+  if '"' in value:
+    value = value.replace('"', "&quot;")
+  if "\r" in value:
+    value = value.replace("\r", "&#13;")
+  if "\n" in value:
+    value = value.replace("\n", "&#10;")
+  if "\t" in value:
+    value = value.replace("\t", "&#09;")
+  return value
+
+def format_attributes(attributes):
+  """
+    Formats the given attributes like svgwrite does: sorted by name,
+    underscores turned into dashes and empty values left out.
+  """
+  items = []
+  for key, value in attributes.items():
+    if value is None or str(value) == "":
+      continue
+    items.append((key.replace("_", "-"), escape_attribute(str(value))))
+  items.sort()
+  return "".join(' %s="%s"' % item for item in items)
+
+def gzip_file(raw):
+  """
+    Returns a gzip file writing into the given binary file. Its header has no
+    file name or time, so the same graph always gives the same bytes.
+  """
+  import gzip
+  return gzip.GzipFile(filename="", mode="wb", fileobj=raw, mtime=0)
+
+def gzip_bytes(data):
+  """
+    Gzips the given bytes the same way .svgz files are written
+  """
+  gzipped = io.BytesIO()
+  with gzip_file(gzipped) as gzip_output:
+    gzip_output.write(data)
+  return gzipped.getvalue()
+
+class ReplacingFile(object):
+  """
+    Text file written to a temporary file next to the given file name, which
+    is renamed over it once closed, or removed when discarded
+  """
+  def __init__(self, file_name):
+    directory, base_name = os.path.split(file_name)
+    self.file_name = file_name
+    self.temp_name = os.path.join(directory, ".%s.%d.%d.tmp" % (base_name, os.getpid(), threading.get_ident()))
+    if file_name.endswith(".svgz"):
+      self.raw = open(self.temp_name, "wb")
+      # Buffered in between, since flushing the gzip file itself would add a sync block
+      self.file = io.TextIOWrapper(io.BufferedWriter(gzip_file(self.raw), WRITE_BUFFER_SIZE),
+        encoding="utf-8")
+    else:
+      self.raw = None
+      self.file = open(self.temp_name, "w", encoding="utf-8", buffering=WRITE_BUFFER_SIZE)
+    self.write = self.file.write
+
+  def flush(self):
+    self.file.flush()
+
+  def close_file(self):
+    try:
+      self.file.close()
+    finally:
+      if self.raw is not None:
+        self.raw.close()
+
+  def close(self):
+    self.close_file()
+    os.replace(self.temp_name, self.file_name)
+
+  def discard(self):
+    try:
+      self.close_file()
+    finally:
+      if os.path.exists(self.temp_name):
+        os.remove(self.temp_name)
+
+def open_output(output):
+  """
+    Opens the given file name for writing, gzipped if it ends in .svgz. The
+    file only replaces the given one once it is closed.
+    File objects are used as they are.
+    Returns the file and whether it should be closed when done.
+  """
+  if not isinstance(output, str):
+    return output, False
+  return ReplacingFile(output), True
+
+class Writer(object):
+  """
+    Shapes that every backend draws as a path
+  """
+  def discard(self):
+    """ Drops a drawing that failed, leaving the output as it was """
+    pass
+
+  def polyline(self, points, stroke, stroke_width):
+    """ Adds a line going through the given (x, y) points """
+    self.path("M" + ", ".join([str(x) + "," + str(y) for x, y in points]),
+      stroke=stroke, stroke_width=stroke_width)
+
+  def arc(self, p0, p1, radius, stroke, stroke_width):
+    """ Adds an arc that bulges to the right as it moves from p0 to p1 """
+    args = {'x0':p0[0],
+        'y0':p0[1],
+        'xradius':radius,
+        'yradius':radius,
+        'ellipseRotation':0, #has no effect for circles
+        'x1':(p1[0]-p0[0]),
+        'y1':(p1[1]-p0[1])}
+    self.path("M %(x0)f,%(y0)f a %(xradius)f,%(yradius)f %(ellipseRotation)f 0,0 %(x1)f,%(y1)f M0,0"%args,
+      stroke=stroke, stroke_width=stroke_width)
+
+class SvgwriteWriter(Writer):
+  """
+    Draws through an svgwrite.Drawing object tree, then saves it at the end
+  """
+  name = "svgwrite"
+
+  def __init__(self, output, size=None, **settings):
+    import svgwrite
+    self.output = output
+    if size is None:
+      self.dwg = svgwrite.Drawing(profile="full")
+    else:
+      self.dwg = svgwrite.Drawing(size=size)
+    self.parents = [self.dwg]
+
+  def rect(self, insert, size, fill):
+    self.parents[-1].add(self.dwg.rect(insert, size, fill=fill))
+
+  def circle(self, center, r, fill):
+    self.parents[-1].add(self.dwg.circle(center=center, r=r, fill=fill))
+
+  def path(self, d, stroke, stroke_width):
+    self.parents[-1].add(self.dwg.path(d=d, fill="none", stroke=stroke, stroke_width=stroke_width))
+
+  def begin_group(self, **attributes):
+    self.parents.append(self.parents[-1].add(self.dwg.g(**attributes)))
+
+  def end_group(self):
+    self.parents.pop()
+
+  def close(self):
+    # The file is only opened now, so a failed drawing leaves no file behind
+    out, owns_output = open_output(self.output)
+    if not owns_output:
+      self.dwg.write(out)
+      return
+    try:
+      self.dwg.write(out)
+    except BaseException:
+      out.discard()
+      raise
+    out.close()
+
+class StreamWriter(Writer):
+  """
+    Writes every element straight to a buffered file as it is drawn
+  """
+  name = "stream"
+
+  def __init__(self, output, size=None, **settings):
+    self.out, self.owns_output = open_output(output)
+    self.colors = {} # escaped colors, since the same few are used over and over
+    self.open_group = False # if the last group tag still needs to be closed
+
+    if size is None:
+      width, height = "100%", "100%"
+    else:
+      width, height = size
+    self.write_header(width, height)
+
+  def write_header(self, width, height):
+    self.out.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+    self.out.write('<svg baseProfile="full" height="%s" version="1.1" width="%s" %s><defs />'
+      % (height, width, SVG_NAMESPACES))
+
+  def color(self, color):
+    escaped = self.colors.get(color)
+    if escaped is None:
+      escaped = self.colors[color] = escape_attribute(str(color))
+    return escaped
+
+  def write(self, element):
+    if self.open_group:
+      self.out.write(">")
+      self.open_group = False
+    self.out.write(element)
+
+  def rect(self, insert, size, fill):
+    self.write('<rect fill="%s" height="%s" width="%s" x="%s" y="%s" />'
+      % (self.color(fill), size[1], size[0], insert[0], insert[1]))
+
+  def circle(self, center, r, fill):
+    self.write('<circle cx="%s" cy="%s" fill="%s" r="%s" />'
+      % (center[0], center[1], self.color(fill), r))
+
+  def path(self, d, stroke, stroke_width):
+    self.write('<path d="%s" fill="none" stroke="%s" stroke-width="%s" />'
+      % (escape_attribute(d), self.color(stroke), stroke_width))
+
+  def begin_group(self, **attributes):
+    self.write("<g" + format_attributes(attributes))
+    self.open_group = True
+
+  def end_group(self):
+    if self.open_group:
+      self.out.write(" />")
+      self.open_group = False
+    else:
+      self.out.write("</g>")
+
+  def write_footer(self):
+    self.out.write("</svg>")
+
+  def close(self):
+    self.write_footer()
+    if self.owns_output:
+      self.out.close()
+    else:
+      self.out.flush()
+
+  def discard(self):
+    if self.owns_output:
+      self.out.discard()
+
+class CompactWriter(StreamWriter):
+  """
+    Streams a size optimized file: shared dots, merged bars, rounded
+    coordinates and relative path commands
+  """
+  name = "compact"
+
+  def __init__(self, output, size=None, precision=DEFAULT_PRECISION, **settings):
+    self.precision = DEFAULT_PRECISION if precision is None else precision
+    self.scale = 10 ** self.precision
+    self.dots = {} # (color, radius) -> id of the shared dot
+    self.bar_color = None # color of the bars that are being merged
+    self.bar_path = []
+    StreamWriter.__init__(self, output, size)
+
+  def write_header(self, width, height):
+    self.out.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+    self.out.write('<svg height="%s" width="%s" xmlns="http://www.w3.org/2000/svg" '
+      'xmlns:xlink="http://www.w3.org/1999/xlink">' % (height, width))
+
+  def number(self, value):
+    """ Formats the given number with at most `precision` decimals """
+    text = "%.*f" % (self.precision, value)
+    if "." in text:
+      text = text.rstrip("0").rstrip(".")
+    if text == "-0":
+      return "0"
+    return text
+
+  def fixed(self, value):
+    """ Rounds the given number to an integer number of 10^-precision steps """
+    return round(value * self.scale)
+
+  def steps(self, steps):
+    """ Formats a number given in 10^-precision steps """
+    return self.number(steps / self.scale)
+
+  def write(self, element):
+    if self.bar_path:
+      self.flush_bars()
+    StreamWriter.write(self, element)
+
+  def flush_bars(self):
+    bar_path = "".join(self.bar_path)
+    self.bar_path = []
+    StreamWriter.write(self, '<path d="%s" fill="%s" />' % (bar_path, self.color(self.bar_color)))
+
+  def rect(self, insert, size, fill):
+    if size[0] <= 0 or size[1] <= 0:
+      return # same as a <rect>, which isn't drawn either
+    # Only merge the bars that follow each other, so the layering stays
+    if fill != self.bar_color and self.bar_path:
+      self.flush_bars()
+    self.bar_color = fill
+    x, y = self.fixed(insert[0]), self.fixed(insert[1])
+    width = self.fixed(insert[0] + size[0]) - x
+    height = self.fixed(insert[1] + size[1]) - y
+    self.bar_path.append("M%s %sh%sv%sh%sz" % (self.steps(x), self.steps(y),
+      self.steps(width), self.steps(height), self.steps(-width)))
+
+  def define(self, element):
+    """ Adds the given element to the shared definitions """
+    self.write("<defs>" + element + "</defs>")
+
+  def circle(self, center, r, fill):
+    dot_id = self.dots.get((fill, r))
+    if dot_id is None:
+      # Define the dot the first time the color is used
+      dot_id = self.dots[(fill, r)] = "d" + str(len(self.dots))
+      self.define('<circle fill="%s" id="%s" r="%s" />'
+        % (self.color(fill), dot_id, self.number(float(r))))
+    self.write('<use x="%s" xlink:href="#%s" y="%s" />'
+      % (self.number(center[0]), dot_id, self.number(center[1])))
+
+  def polyline(self, points, stroke, stroke_width):
+    d = []
+    last_x = last_y = None
+    for x, y in points:
+      x, y = self.fixed(x), self.fixed(y)
+      if last_x is None:
+        d.append("M%s %sl" % (self.steps(x), self.steps(y)))
+      else:
+        d.append("%s %s " % (self.steps(x - last_x), self.steps(y - last_y)))
+      last_x, last_y = x, y
+    self.path("".join(d).rstrip("l "), stroke, stroke_width)
+
+  def arc(self, p0, p1, radius, stroke, stroke_width):
+    x0, y0 = self.fixed(p0[0]), self.fixed(p0[1])
+    x1, y1 = self.fixed(p1[0]), self.fixed(p1[1])
+    radius = self.number(radius)
+    self.path("M%s %sa%s %s 0 0 0 %s %s" % (self.steps(x0), self.steps(y0),
+      radius, radius, self.steps(x1 - x0), self.steps(y1 - y0)), stroke, stroke_width)
+
+  def path(self, d, stroke, stroke_width):
+    if isinstance(stroke_width, float):
+      stroke_width = self.number(stroke_width)
+    self.write('<path d="%s" fill="none" stroke="%s" stroke-width="%s" />'
+      % (escape_attribute(d), self.color(stroke), stroke_width))
+
+  def end_group(self):
+    if self.bar_path:
+      self.flush_bars()
+    StreamWriter.end_group(self)
+
+  def close(self):
+    if self.bar_path:
+      self.flush_bars()
+    StreamWriter.close(self)
+
+WRITERS = {
+  SvgwriteWriter.name : SvgwriteWriter,
+  StreamWriter.name : StreamWriter,
+  CompactWriter.name : CompactWriter,
+}
+
+def open_writer(kind, output, size=None, precision=None):
+  """
+    Returns a writer of the given kind that draws into the given file name
+    or file object. size is the (width, height) of the image, if any, and
+    precision is the number of decimals kept by the compact writer.
+  """
+  if kind not in WRITERS:
+    raise ValueError("unknown writer backend: " + str(kind))
+  return WRITERS[kind](output, size, precision=precision)
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# tiles.py
+# Last Updated:
+# Purpose: Splits the rectangle graphs of very long series into a pyramid of
+#          small SVG tiles, so a viewer only loads the part that is visible:
+#          - level 0 is the full detail, cut into tiles of `tile_points` points
+#          - every level above it bins twice as many points into each point
+#            (with the highest or the mean value of the bin), up to the level
+#            that fits in a single tile
+#          Each group gets a "<name>.tiles" directory with the tiles and an
+#          index.json that maps the x range of every tile to its file.
+# Notes:
+#       - The tiles are made one at a time straight from the series, so only
+#         one tile is ever held in memory
+#       - Tiles are drawn like any other group (so --jobs and --cache work),
+#         at the same x positions as the whole graph minus the tile's x offset
+#       - Series that fit in a single tile and pie/donut graphs aren't tiled
+#
+from array import array
+import json     # for the index
+import os       # for the tile directories
+
+from dataset import Dataset
+
+TILES_SUFFIX = ".tiles"
+INDEX_NAME = "index.json"
+
+def bin_values(values, start, end, bin_size, aggregate):
+  """
+    Returns the values from start to end, binned bin_size at a time into
+    their highest value ("max") or their mean ("mean")
+  """
+  binned = array("d")
+  if bin_size == 1:
+    binned.extend(values[start:end])
+    return binned
+  for bin_start in range(start, min(end, len(values)), bin_size):
+    run = values[bin_start:min(bin_start + bin_size, end)]
+    if aggregate == "mean":
+      binned.append(sum(run) / len(run))
+    else:
+      binned.append(max(run))
+  return binned
+
+def tile_levels(points, tile_points):
+  """
+    Returns the bin size of every level, from the full detail (1) up to
+    the level that fits in a single tile
+  """
+  bin_sizes = [1]
+  while (points + bin_sizes[-1] - 1) // bin_sizes[-1] > tile_points:
+    bin_sizes.append(bin_sizes[-1] * 2)
+  return bin_sizes
+
+def tile_group(dataset, tile_points, out_dir=None, aggregate="max"):
+  """
+    Yields a Dataset for every tile of the given rectangle graph, then
+    writes the index of the tiles
+  """
+  config = dataset.config
+  tile_dir = config["filename"] + TILES_SUFFIX
+  os.makedirs(os.path.join(out_dir or "", tile_dir), exist_ok=True)
+  points = max(len(values) for values in dataset.series)
+  index = {
+    "name" : config["filename"],
+    "rect_width" : config["rect_width"],
+    "points" : points,
+    "tile_points" : tile_points,
+    "levels" : [],
+  }
+
+  for level, bin_size in enumerate(tile_levels(points, tile_points)):
+    level_points = (points + bin_size - 1) // bin_size
+    rect_width = config["rect_width"] * bin_size
+    tiles = []
+    for tile_index, first in enumerate(range(0, level_points, tile_points)):
+      # One point more than the tile holds, so the lines run into the next tile
+      start = first * bin_size
+      end = (first + tile_points + 1) * bin_size
+      tile_name = "L%d_%06d" % (level, tile_index)
+      tile = Dataset(dict(config, filename=os.path.join(tile_dir, tile_name), rect_width=rect_width))
+      for color, values in zip(dataset.colors, dataset.series):
+        tile.add_series(color, bin_values(values, start, end, bin_size, aggregate))
+      tiles.append({
+        "file" : tile_name + ".svg",
+        "x" : [first * rect_width, (first + tile_points) * rect_width],
+        "x_offset" : first * rect_width,
+        "points" : [start, min(end, points)],
+      })
+      yield tile
+    index["levels"].append({
+      "level" : level,
+      "bin_size" : bin_size,
+      "rect_width" : rect_width,
+      "tiles" : tiles,
+    })
+
+  with open(os.path.join(out_dir or "", tile_dir, INDEX_NAME), "w") as index_output:
+    json.dump(index, index_output, indent=1)
+    index_output.write("\n")
+
+def tiled_groups(groups, tile_points, out_dir=None, aggregate="max"):
+  """
+    Yields the given groups, with the long rectangle graphs replaced by
+    their tiles
+  """
+  for dataset in groups:
+    if not isinstance(dataset, Dataset) or dataset.config["draw_mode"] != "r" or \
+        max([len(values) for values in dataset.series], default=0) <= tile_points:
+      yield dataset
+      continue
+    yield from tile_group(dataset, tile_points, out_dir, aggregate)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+#coding:utf-8
+
+# watch.py
+# Last Updated:
+# Purpose: Keeps the graphs of a CSV file up to date while it is edited.
+#          The file is polled, and once it stops changing (debounce) only the
+#          groups whose rows changed are parsed and drawn again. The graphs of
+#          groups that were removed from the file are deleted.
+# Notes:
+#       - The groups are compared by a hash of their rows, so a save costs a
+#         quick scan of the file plus drawing what was edited
+#       - Polling is used since inotify isn't in the standard library
+#
+import hashlib  # for comparing the groups
+import os       # for file checking
+import sys      # for reporting errors
+import time     # for polling
+
+import graphs
+import group_index
+
+DEFAULT_POLL = 0.5 # seconds between checks of the csv file
+DEFAULT_DEBOUNCE = 0.3 # seconds the csv file has to stay the same
+
+class Watcher(object):
+  """
+    Draws the groups of a csv file that changed since the last update
+  """
+  def __init__(self, csv_file, options=None, jobs=1, only=None):
+    self.csv_file = csv_file
+    self.options = dict(options or {})
+    self.jobs = jobs
+    self.only = only
+    self.digests = {} # group name -> hash of its rows, as last drawn
+    self.file_stat = None # (size, mtime) of the csv file, as last scanned
+
+  def stat(self):
+    """
+      Returns the size and mtime of the csv file, or None while it's missing
+      (eg: an editor that saves by replacing the file)
+    """
+    try:
+      stat = os.stat(self.csv_file)
+    except OSError:
+      return None
+    return (stat.st_size, stat.st_mtime_ns)
+
+  def scan(self):
+    """
+      Hashes the rows of every group in the csv file.
+      Returns {group name: [hash, index entries]}, in file order.
+    """
+    groups = {}
+    with open(self.csv_file, "rb") as csv_input:
+      for entry in group_index.build_group_index(self.csv_file):
+        if self.only is not None and entry["name"] != self.only:
+          continue
+        csv_input.seek(entry["offset"])
+        group = groups.setdefault(entry["name"], [hashlib.sha1(), []])
+        group[0].update(csv_input.read(entry["length"]))
+        group[1].append(entry)
+    for group in groups.values():
+      group[0] = group[0].hexdigest()
+    return groups
+
+  def draw(self, datasets):
+    """
+      Draws the given groups and returns the names of the ones that failed
+    """
+    if self.jobs > 1:
+      results = graphs.render_groups(datasets, self.options, self.jobs)
+      return [name for name, output, error in results if error is not None]
+
+    failed = []
+    for dataset in datasets:
+      try:
+        graphs.draw_rect_graph(dataset, self.options)
+      except Exception as error:
+        print("Failed to render", dataset.config["filename"] + ":",
+          "%s: %s" % (type(error).__name__, error), file=sys.stderr)
+        failed.append(dataset.config["filename"])
+    return failed
+
+  def update(self):
+    """
+      Draws the groups that changed since the last update and deletes the
+      graphs of the groups that are gone.
+      Returns the number of groups drawn and removed.
+    """
+    self.file_stat = self.stat()
+    groups = self.scan()
+
+    datasets = []
+    failed = []
+    for name, (digest, entries) in groups.items():
+      if self.digests.get(name) == digest:
+        continue
+      try:
+        for entry in entries:
+          datasets.extend(graphs.parse_groups(group_index.read_group_lines(self.csv_file, entry)))
+      except ValueError as error: # eg: a number that is still being typed
+        print("Failed to read", name + ":", error, file=sys.stderr)
+        failed.append(name)
+    failed.extend(self.draw(datasets))
+
+    removed = [name for name in self.digests if name not in groups]
+    for name in removed:
+      output = graphs.output_name({"filename" : name}, self.options)
+      if os.path.isfile(output):
+        os.remove(output)
+        print("Removed file:", output)
+
+    self.digests = {name : group[0] for name, group in groups.items()}
+    for name in failed:
+      self.digests.pop(name, None) # so it is tried again on the next change
+    return len(datasets), len(removed)
+
+  def wait_for_change(self, poll=DEFAULT_POLL, debounce=DEFAULT_DEBOUNCE):
+    """
+      Waits until the csv file is different from the last scan and then
+      stays the same for `debounce` seconds
+    """
+    while True:
+      time.sleep(poll)
+      file_stat = self.stat()
+      if file_stat is None or file_stat == self.file_stat:
+        continue
+      # Wait for the editor to finish saving
+      while True:
+        time.sleep(debounce)
+        settled = self.stat()
+        if settled == file_stat:
+          break
+        file_stat = settled
+      if file_stat is not None:
+        return
+
+  def watch(self, poll=DEFAULT_POLL, debounce=DEFAULT_DEBOUNCE, updates=None):
+    """
+      Draws the graphs, then draws them again every time the csv file changes.
+      Runs until interrupted, or for the given number of updates.
+    """
+    count = 0
+    while True:
+      start = time.perf_counter()
+      drawn, removed = self.update()
+      print("=== %d drawn, %d removed in %.3fs, watching %s"
+        % (drawn, removed, time.perf_counter() - start, self.csv_file))
+      sys.stdout.flush()
+      count += 1
+      if updates is not None and count >= updates:
+        return
+      self.wait_for_change(poll, debounce)
+
+def watch_csv(csv_file, out_dir=None, options=None, jobs=1, only=None,
+    poll=DEFAULT_POLL, debounce=DEFAULT_DEBOUNCE, updates=None):
+  """
+    Keeps the graphs of the given csv file up to date (see Watcher)
+  """
+  options = dict(options or {})
+  if out_dir is not None:
+    options["out_dir"] = out_dir
+    os.makedirs(out_dir, exist_ok=True)
+  Watcher(csv_file, options, jobs, only).watch(poll, debounce, updates)